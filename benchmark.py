@@ -0,0 +1,158 @@
+# This script benchmarks geocoding throughput offline. It starts a local
+# stand-in for Nominatim's /search endpoint and drives the geocoding engine
+# in main.py against it with synthetic addresses.
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+
+import main
+
+
+class MockNominatimHandler(BaseHTTPRequestHandler):
+    """
+    Answers GET /search like Nominatim does, with a deterministic point in
+    Massachusetts for each query. The server's `options` control the
+    simulated latency and how often it answers with a 503, a 429 or no
+    result at all.
+    """
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; with Nagle on, the body
+    # waits for the client's delayed ACK and every request gains ~40 ms
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path.rstrip("/") != "/search":
+            self._send(404, {"error": "not found"})
+            return
+
+        options = self.server.options
+        time.sleep(max(0.0, random.gauss(options.latency, options.latency_jitter)))
+        roll = random.random()
+        if roll < options.error_rate:
+            self._send(503, {"error": "service unavailable"})
+            return
+        roll -= options.error_rate
+        if roll < options.rate_limit_rate:
+            self._send(429, {"error": "rate limited"}, {"Retry-After": str(options.retry_after)})
+            return
+        roll -= options.rate_limit_rate
+        if roll < options.not_found_rate:
+            self._send(200, [])
+            return
+
+        params = parse_qs(url.query)
+        query = params.get("q", [""])[0] or ", ".join(
+            params[field][0] for field in ("street", "city", "state", "postalcode") if field in params
+        )
+        digest = hashlib.md5(query.encode()).digest()
+        lat = 41.3 + 1.5 * digest[0] / 255
+        lon = -73.4 + 3.4 * digest[1] / 255
+        self._send(200, [{
+            "place_id": int.from_bytes(digest[:4], "big"),
+            "lat": f"{lat:.7f}",
+            "lon": f"{lon:.7f}",
+            "display_name": query,
+        }])
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_mock_server(options, port=0):
+    """
+    Starts the mock Nominatim server on a background thread and returns it.
+    Its address is server.server_address.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockNominatimHandler)
+    server.daemon_threads = True
+    server.options = options
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def synthetic_addresses(n):
+    """
+    Returns n distinct normalized addresses.
+    """
+    return [f"{i} benchmark st, boston, ma {2100 + i % 100:05d}" for i in range(n)]
+
+
+def run_benchmark(n, server, concurrency, rate):
+    """
+    Geocodes n synthetic addresses against the mock server through
+    main.geocode_many (the engine under do_geocoding) with no cache, and
+    returns the METRICS summary for the run.
+    """
+    host, port = server.server_address
+    geolocator = main.NominatimBackend(domain=f"{host}:{port}", scheme="http")
+    retry = main.RetryPolicy(base_delay=0.05, max_delay=1.0)
+    breaker = main.CircuitBreaker()
+
+    main.METRICS.reset()
+    main.geocode_many(
+        synthetic_addresses(n), geolocator, concurrency=concurrency, rate=rate,
+        retry=retry, breaker=breaker,
+    )
+    return main.METRICS.summary()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(
+        description="Benchmark geocoding throughput against a local mock Nominatim server."
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000],
+                        help="numbers of addresses to geocode")
+    parser.add_argument("--concurrency", type=int, default=32, help="requests in flight")
+    parser.add_argument("--rate", type=float, default=None,
+                        help="client rate limit in requests/second (default: unlimited)")
+    parser.add_argument("--latency", type=float, default=0.02, help="mean server latency in seconds")
+    parser.add_argument("--latency-jitter", type=float, default=0.005,
+                        help="standard deviation of the server latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 503 responses")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of 429 responses")
+    parser.add_argument("--retry-after", type=int, default=1,
+                        help="Retry-After seconds sent with 429 responses")
+    parser.add_argument("--not-found-rate", type=float, default=0.0,
+                        help="fraction of queries with no result")
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    server = start_mock_server(args)
+    print(f"Mock Nominatim listening on http://{server.server_address[0]}:{server.server_address[1]}")
+
+    results = []
+    for n in args.sizes:
+        summary = run_benchmark(n, server, args.concurrency, args.rate)
+        results.append({"addresses": n, **summary})
+        print(f"{n:>8} addresses: {summary['requests_per_second']:>9.1f} req/s, "
+              f"p50 {summary['latency_p50_seconds']:.3f}s, "
+              f"p95 {summary['latency_p95_seconds']:.3f}s, "
+              f"p99 {summary['latency_p99_seconds']:.3f}s, "
+              f"{summary['retries']} retries, {summary['requests']} requests "
+              f"in {summary['elapsed_seconds']:.1f}s")
+
+    server.shutdown()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main_cli()
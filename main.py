@@ -1,112 +1,2067 @@
 # This script reads a list of addresses from a CSV, geocodes them,
 # and creates a static map using matplotlib and cartopy.
 
+import numpy as np
 import pandas as pd
+import matplotlib.colors as mcolors
 import matplotlib.pyplot as plt
+from matplotlib.lines import Line2D
 import cartopy.crs as ccrs
 import cartopy.feature as cfeature
+from geopy.adapters import RequestsAdapter
 from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut, GeocoderServiceError
+from geopy.exc import GeocoderRateLimited, GeocoderServiceError, GeocoderTimedOut, GeocoderUnavailable
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from collections import deque, namedtuple
 from pathlib import Path
+from urllib.parse import urlsplit
+import argparse
+import asyncio
+import bisect
+import csv
+import functools
+import hashlib
+import itertools
+import json
+import random
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
 import time
 import geopandas as gpd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.feather
+import pyarrow.parquet as pq
+import shapely
 
 
 INPUT_FILE = "data.csv"
-GEOCODED_FILE = "geocoded.csv"
+GEOCODED_FILE = "geocoded.parquet"
+BOUNDARY_FILE = "MA.geojson"
 
-def geocode_address(address, geolocator):
+# Parsed boundaries are cached in BOUNDARY_CACHE_DIR as Feather files with
+# WKB geometry, keyed on the hash of the source file and the projection and
+# simplification applied, so each boundary file is only parsed once.
+BOUNDARY_CACHE_DIR = "boundary_cache"
+
+# The boundary is drawn simplified so that no vertex moves more than
+# BOUNDARY_MAX_ERROR_PX output pixels. Tolerances are rounded down to a
+# level of detail BOUNDARY_LOD_BASE * 2**k (in the boundary's units) so that
+# every simplified level is cached and shared between renders.
+BOUNDARY_MAX_ERROR_PX = 0.5
+BOUNDARY_LOD_BASE = 1e-5
+
+# The geocoded output is GeoParquet: typed, compressed columns plus a WKB
+# point geometry column, one row group per input chunk. With
+# PARTITION_BY_STATE it is instead a directory partitioned on state_abbr.
+PARQUET_COMPRESSION = "zstd"
+PARTITION_BY_STATE = False
+
+# Records what GEOCODED_FILE was built from (input content hash, geocoder
+# configuration, normalizer version) so stale output is detected.
+MANIFEST_FILE = "geocoded.manifest.json"
+
+# SHA-256 digests of the boundary and reference tables are remembered in
+# FILE_HASH_INDEX against each file's size and modification time, so an
+# unchanged file is only hashed once.
+FILE_HASH_INDEX = "file_hashes.json"
+
+# Geocodes that fall outside BOUNDARY_FILE (grown by REGION_TOLERANCE_DEGREES
+# to allow for coastline simplification) are rejected and retried with the
+# next backend or fallback tier. Set VALIDATE_REGION to False to keep them.
+VALIDATE_REGION = True
+REGION_TOLERANCE_DEGREES = 0.01
+
+# Geocoding metrics are written to METRICS_FILE as JSON at the end of each
+# run, and also to PROMETHEUS_FILE in the Prometheus text format if set.
+METRICS_FILE = "geocode_metrics.json"
+PROMETHEUS_FILE = None
+
+# Status codes returned by geocode_many
+STATUS_OK = 0
+STATUS_CACHED = 1
+STATUS_NOT_FOUND = 2
+STATUS_FAILED = 3
+
+# Persistent geocode cache. Entries older than the TTL are treated as misses,
+# and the least recently used entries are evicted past the size limit.
+# Eviction runs in one go once the cache is CACHE_EVICTION_BATCH entries over
+# the limit, and writers wait up to CACHE_BUSY_TIMEOUT seconds for a lock.
+CACHE_FILE = "geocode_cache.sqlite"
+CACHE_TTL_SECONDS = 90 * 24 * 60 * 60
+CACHE_MAX_ENTRIES = 1_000_000
+CACHE_EVICTION_BATCH = 10_000
+CACHE_BUSY_TIMEOUT = 30.0
+
+# Geocoding concurrency. GEOCODE_RATE_LIMIT is in requests per second and
+# the defaults follow the public Nominatim usage policy; raise them when
+# pointing at a self-hosted geocoder. GEOCODE_DAILY_QUOTA of None is unlimited;
+# requests are counted per UTC day in CACHE_FILE, so the quota spans runs.
+GEOCODE_CONCURRENCY = 1
+GEOCODE_RATE_LIMIT = 1.0
+GEOCODE_DAILY_QUOTA = None
+
+# Every Nominatim geolocator keeps a pooled keep-alive HTTP session that is
+# shared by all of its worker threads. Keep HTTP_POOL_SIZE at or above
+# GEOCODE_CONCURRENCY so no request waits for (or re-opens) a connection.
+HTTP_POOL_SIZE = 32
+
+# Retries of transient geocoding errors back off exponentially with full
+# jitter, and the circuit breaker pauses every worker for CIRCUIT_COOLDOWN
+# seconds once more than CIRCUIT_FAILURE_RATE of the last CIRCUIT_WINDOW
+# requests have failed.
+RETRY_MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+CIRCUIT_WINDOW = 20
+CIRCUIT_FAILURE_RATE = 0.5
+CIRCUIT_COOLDOWN = 30.0
+
+# Which geocoder backend(s) to use: "nominatim", "local", or
+# "local+nominatim" to resolve from the local reference table first and only
+# send misses to Nominatim. The local table is an OpenAddresses-style CSV
+# (NUMBER, STREET, CITY, REGION, POSTCODE, LAT, LON) which is loaded into an
+# indexed SQLite database the first time it is used.
+GEOCODER_BACKEND = "nominatim"
+LOCAL_TABLE_FILE = "addresses.csv"
+LOCAL_TABLE_DB = "addresses.sqlite"
+
+# Self-hosted Nominatim replicas, e.g. ["http://geo1:8080", "http://geo2:8080"].
+# When set, the "nominatim" backend consistent-hashes addresses across them
+# and geocodes each shard in GEOCODER_WORKERS_PER_ENDPOINT worker processes.
+# GEOCODE_CONCURRENCY and GEOCODE_RATE_LIMIT then apply per endpoint, and
+# GEOCODE_DAILY_QUOTA is not enforced.
+GEOCODER_ENDPOINTS = []
+GEOCODER_WORKERS_PER_ENDPOINT = 1
+
+# Results are appended to the checkpoint journal as they arrive (flushed to
+# disk at least every CHECKPOINT_FLUSH_SECONDS) so an interrupted run can
+# resume where it stopped. The journal is removed once GEOCODED_FILE is saved.
+CHECKPOINT_FILE = "geocoded.journal.csv"
+CHECKPOINT_FLUSH_SECONDS = 1.0
+
+# Rows the geocoder cannot resolve from the full address are retried with a
+# relaxed "street, zip" query and then placed at the centroid of their ZIP5
+# from ZIP_CENTROIDS_FILE (a CSV with zip, latitude, longitude columns) if
+# it exists. The output records which of these PRECISION_* levels each
+# coordinate came from.
+ZIP_CENTROIDS_FILE = "zip_centroids.csv"
+PRECISION_ADDRESS = "address"
+PRECISION_STREET_ZIP = "street_zip"
+PRECISION_ZIP = "zip_centroid"
+
+# Number of input rows read, geocoded and written at a time.
+INPUT_CHUNKSIZE = 100_000
+
+# Columns that identify an input row. A row whose values in these columns
+# match a row already in GEOCODED_FILE keeps its existing coordinates when
+# geocoding incrementally.
+ROW_KEY_COLUMNS = ["inst_name", "address", "city", "state_abbr", "zip"]
+
+# Each institution gets its own color and legend entry. Past
+# LEGEND_MAX_ENTRIES the legend would not fit under the map, so it is written
+# to LEGEND_TABLE_FILE (a CSV of name and hex color) instead.
+MAP_FILE = "address_map.png"
+MAP_TITLE = "Massachusetts Community Colleges"
+MAP_FIGSIZE = (10, 12)
+MAP_DPI = 300
+MARKER_SIZE = 70
+LEGEND_MAX_ENTRIES = 40
+LEGEND_TABLE_FILE = "address_map_legend.csv"
+
+# How points are drawn: "points" draws a marker per institution, "raster"
+# bins them into a grid with one cell per output pixel and shades the counts
+# with RASTER_CMAP ("log" or "eq_hist" RASTER_NORMALIZATION), and "auto"
+# switches to "raster" above RASTER_THRESHOLD points.
+RENDER_MODE = "auto"
+RASTER_THRESHOLD = 200_000
+RASTER_CMAP = "viridis"
+RASTER_NORMALIZATION = "eq_hist"
+
+# Points closer together than about CLUSTER_RADIUS_PX output pixels are
+# merged into one marker sized and labeled by how many points it holds.
+# Clusters are recomputed for the extent and resolution of every render. Set
+# to None to draw every point.
+CLUSTER_RADIUS_PX = 30
+CLUSTER_COLOR = "dimgray"
+
+# The static part of the map (boundary and title) is rendered once per
+# figure size, DPI and extent and cached in BASEMAP_CACHE_DIR as a
+# compressed RGBA image; each map then only draws its points on top. Only
+# the BASEMAP_CACHE_MAX_FILES most recently used basemaps are kept. Bump
+# BASEMAP_VERSION whenever render_basemap changes what it draws.
+BASEMAP_CACHE_DIR = "basemap_cache"
+BASEMAP_CACHE_MAX_FILES = 16
+BASEMAP_VERSION = 1
+
+# Tile export (main.py --tiles) renders the boundary and points as 256px Web
+# Mercator z/x/y PNG tiles into TILE_DIR for zoom levels TILE_MIN_ZOOM to
+# TILE_MAX_ZOOM, using TILE_WORKERS processes (None for one per CPU). Tiles
+# that neither touch the boundary nor have a marker within TILE_MARGIN_PX of
+# them are skipped. TILE_DIR/manifest.json records a hash of what went into
+# each tile so a rerun only renders the tiles whose contents changed.
+TILE_DIR = "tiles"
+TILE_MIN_ZOOM = 6
+TILE_MAX_ZOOM = 12
+TILE_SIZE = 256
+TILE_DPI = 72
+TILE_MARGIN_PX = 16
+TILE_WORKERS = None
+
+# Half the width of the Web Mercator world in meters
+MERCATOR_HALF_WIDTH = 20037508.342789244
+
+# The first colors of the map palette; more are generated as needed.
+BASE_COLORS = ['red', 'blue', 'green', 'purple', 'orange', 'cyan', 'magenta', 'lime',
+               'brown', 'pink', 'gray', 'olive', 'teal', 'navy', 'maroon', 'gold']
+
+
+# Bump NORMALIZER_VERSION whenever normalize_addresses changes its output.
+NORMALIZER_VERSION = 2
+
+USPS_SUFFIXES = {
+    "alley": "aly", "avenue": "ave", "boulevard": "blvd", "circle": "cir",
+    "court": "ct", "drive": "dr", "expressway": "expy", "highway": "hwy",
+    "lane": "ln", "parkway": "pkwy", "place": "pl", "road": "rd",
+    "route": "rte", "square": "sq", "street": "st", "terrace": "ter",
+    "turnpike": "tpke",
+}
+USPS_DIRECTIONALS = {
+    "north": "n", "south": "s", "east": "e", "west": "w",
+    "northeast": "ne", "northwest": "nw", "southeast": "se", "southwest": "sw",
+}
+# Only the street's trailing suffix is abbreviated (optionally followed by a
+# directional), so that "1 Court Square" becomes "1 court sq" and
+# "12 Route 9" stays as it is
+_SUFFIX_RE = (r"\b(" + "|".join(USPS_SUFFIXES) + r")"
+              r"(?=(?: (?:" + "|".join([*USPS_DIRECTIONALS, *USPS_DIRECTIONALS.values()]) + r"))?$)")
+# A directional is only abbreviated in front of a street name, so that
+# "West Street" stays "west st" rather than becoming "w st"
+_DIRECTIONAL_RE = (r"\b(" + "|".join(sorted(USPS_DIRECTIONALS, key=len, reverse=True)) + r")\b"
+                   r"(?= (?!(?:" + "|".join(USPS_SUFFIXES.values()) + r")\b)\w)")
+
+
+def normalize_addresses(addresses):
+    """
+    Normalizes a Series of "street, city, state zip" addresses so that
+    spellings of the same address map to the same string: case folding,
+    USPS abbreviations of the street's trailing suffix and of directionals
+    in front of the street name, collapsed whitespace and punctuation, and
+    ZIP+4 truncated to ZIP5. The result is also the query sent to the
+    geocoders, so words inside the street name are left alone.
+    Missing addresses stay missing, so they are never looked up or cached.
+    """
+    if addresses.empty:
+        return addresses
+    addresses = addresses.str.lower().str.replace(".", "", regex=False)
+    addresses = addresses.str.replace(r"\s+", " ", regex=True).str.strip()
+    addresses = addresses.str.replace(r"\s*,\s*", ", ", regex=True)
+    addresses = addresses.str.replace(r"\b(\d{5})-\d{4}\b", r"\1", regex=True)
+
+    parts = addresses.str.split(", ", n=1, expand=True)
+    street = parts[0].str.replace(_SUFFIX_RE, lambda m: USPS_SUFFIXES[m.group(1)], regex=True)
+    street = street.str.replace(_DIRECTIONAL_RE, lambda m: USPS_DIRECTIONALS[m.group(1)], regex=True)
+    if parts.shape[1] == 1:
+        return street
+    return street.str.cat(parts[1], sep=", ", na_rep="").str.rstrip(", ").where(addresses.notna())
+
+
+def normalize_cache_key(address):
+    """
+    Returns the key an address is stored under in the geocode cache.
+    """
+    return " ".join(str(address).lower().split())
+
+
+class GeocodeMetrics:
+    """
+    Thread-safe counters and a request latency histogram for geocoding.
+    Latencies are binned into log-spaced buckets from 1 ms to 100 s, so
+    memory stays constant however many requests are made.
+    """
+    COUNTERS = ("requests", "found", "not_found", "retries", "timeouts", "errors",
+                "cache_hits", "cache_negative_hits", "cache_misses", "quota_exhausted",
+                "out_of_region")
+    BUCKETS = np.geomspace(0.001, 100, 61)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = dict.fromkeys(self.COUNTERS, 0)
+            self.latency_counts = np.zeros(len(self.BUCKETS) + 1, dtype=np.int64)
+            self.latency_sum = 0.0
+            self.started = time.monotonic()
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counts[name] += n
+
+    def observe(self, seconds):
+        """
+        Records the latency of one request to the geocoder.
+        """
+        with self._lock:
+            self.latency_counts[np.searchsorted(self.BUCKETS, seconds)] += 1
+            self.latency_sum += seconds
+
+    def merge(self, state):
+        """
+        Adds in the counts from another GeocodeMetrics' state(), e.g. one
+        collected in a worker process.
+        """
+        with self._lock:
+            for name, n in state["counts"].items():
+                self.counts[name] += n
+            self.latency_counts += state["latency_counts"]
+            self.latency_sum += state["latency_sum"]
+
+    def state(self):
+        with self._lock:
+            return {"counts": dict(self.counts), "latency_counts": self.latency_counts.copy(),
+                    "latency_sum": self.latency_sum}
+
+    def percentile(self, q):
+        """
+        Returns the upper bound of the bucket holding the q-th percentile
+        request latency in seconds, or None if no requests were made.
+        """
+        total = self.latency_counts.sum()
+        if not total:
+            return None
+        i = int(np.searchsorted(np.cumsum(self.latency_counts), total * q / 100))
+        return float(self.BUCKETS[min(i, len(self.BUCKETS) - 1)])
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        return {
+            **self.counts,
+            "elapsed_seconds": round(elapsed, 3),
+            "requests_per_second": round(self.counts["requests"] / elapsed, 3) if elapsed else None,
+            "latency_p50_seconds": self.percentile(50),
+            "latency_p95_seconds": self.percentile(95),
+            "latency_p99_seconds": self.percentile(99),
+        }
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def write_prometheus(self, path):
+        lines = []
+        for name in self.COUNTERS:
+            lines.append(f"# TYPE geocode_{name}_total counter")
+            lines.append(f"geocode_{name}_total {self.counts[name]}")
+        lines.append("# TYPE geocode_request_duration_seconds histogram")
+        for bound, n in zip(self.BUCKETS, np.cumsum(self.latency_counts)):
+            lines.append(f'geocode_request_duration_seconds_bucket{{le="{bound:.6g}"}} {n}')
+        lines.append(f'geocode_request_duration_seconds_bucket{{le="+Inf"}} {self.latency_counts.sum()}')
+        lines.append(f"geocode_request_duration_seconds_sum {self.latency_sum}")
+        lines.append(f"geocode_request_duration_seconds_count {self.latency_counts.sum()}")
+        Path(path).write_text("\n".join(lines) + "\n")
+
+
+METRICS = GeocodeMetrics()
+
+
+class GeocodeCache:
+    """
+    SQLite-backed key/value store of geocoding results keyed on the
+    normalized full address. Misses are cached too (with NULL coordinates)
+    so addresses the geocoder cannot find are not requested again.
+    The database is opened in WAL mode so readers never block the writer.
+    """
+
+    def __init__(self, path=CACHE_FILE, ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES,
+                 eviction_batch=CACHE_EVICTION_BATCH, timeout=CACHE_BUSY_TIMEOUT):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.eviction_batch = eviction_batch
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocodes ("
+            " key TEXT PRIMARY KEY,"
+            " latitude REAL,"
+            " longitude REAL,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS geocodes_accessed ON geocodes (accessed)")
+        self._conn.commit()
+        # Upper bound on the row count; replaced entries make it overcount,
+        # so it is re-counted exactly before evicting
+        self._count = self._conn.execute("SELECT COUNT(*) FROM geocodes").fetchone()[0]
+
+    def get(self, address):
+        """
+        Returns the cached (latitude, longitude) for an address, or None if
+        the address is not cached or its entry has expired.
+        """
+        key = normalize_cache_key(address)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT latitude, longitude, created FROM geocodes WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                METRICS.count("cache_misses")
+                return None
+            if self.ttl is not None and now - row[2] > self.ttl:
+                self._conn.execute("DELETE FROM geocodes WHERE key = ?", (key,))
+                self._conn.commit()
+                METRICS.count("cache_misses")
+                return None
+            self._conn.execute("UPDATE geocodes SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        METRICS.count("cache_hits" if row[0] is not None else "cache_negative_hits")
+        return (row[0], row[1])
+
+    def get_many(self, addresses):
+        """
+        Bulk version of get(). Returns a list aligned with `addresses` holding
+        the cached (latitude, longitude) or None for each address.
+        """
+        keys = [normalize_cache_key(address) for address in addresses]
+        now = time.time()
+        found = {}
+        with self._lock:
+            # Stay under SQLite's limit on the number of bound parameters
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._conn.execute(
+                    "SELECT key, latitude, longitude, created FROM geocodes"
+                    f" WHERE key IN ({', '.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for key, latitude, longitude, created in rows:
+                    if self.ttl is None or now - created <= self.ttl:
+                        found[key] = (latitude, longitude)
+            self._conn.executemany(
+                "UPDATE geocodes SET accessed = ? WHERE key = ?", ((now, key) for key in found)
+            )
+            self._conn.commit()
+        results = [found.get(key) for key in keys]
+        negative = sum(1 for result in found.values() if result[0] is None)
+        METRICS.count("cache_hits", len(found) - negative)
+        METRICS.count("cache_negative_hits", negative)
+        METRICS.count("cache_misses", len(keys) - len(found))
+        return results
+
+    def set(self, address, latitude, longitude):
+        """
+        Stores the result for an address, evicting the least recently used
+        entries once the cache has grown eviction_batch entries past its
+        size limit.
+        """
+        key = normalize_cache_key(address)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?, ?, ?)",
+                (key, latitude, longitude, now, now),
+            )
+            self._count += 1
+            if self.max_entries is not None and self._count > self.max_entries + self.eviction_batch:
+                self._evict()
+            self._conn.commit()
+
+    def set_many(self, results):
+        """
+        Bulk version of set() taking (address, latitude, longitude) tuples,
+        written in a single transaction.
+        """
+        now = time.time()
+        rows = [(normalize_cache_key(address), latitude, longitude, now, now)
+                for address, latitude, longitude in results]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?, ?, ?)", rows)
+            self._count += len(rows)
+            if self.max_entries is not None and self._count > self.max_entries + self.eviction_batch:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """
+        Deletes the least recently used entries down to max_entries. The
+        caller must hold the lock.
+        """
+        self._count = self._conn.execute("SELECT COUNT(*) FROM geocodes").fetchone()[0]
+        excess = self._count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM geocodes WHERE key IN ("
+                " SELECT key FROM geocodes ORDER BY accessed LIMIT ?)",
+                (excess,),
+            )
+            self._count = self.max_entries
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+Location = namedtuple("Location", ["latitude", "longitude"])
+
+
+class GeocoderBackend(ABC):
+    """
+    Interface that geocode_address dispatches through. geocode() returns an
+    object with `latitude` and `longitude` attributes, or None if the address
+    could not be found, and raises geopy's GeocoderTimedOut or
+    GeocoderServiceError subclasses on failure. geopy geocoders satisfy it
+    without subclassing.
+
+    Results from `remote` backends are cached and rate limited, results from
+    local ones are not.
+    """
+    name = None
+    remote = True
+
+    @abstractmethod
+    def geocode(self, query, timeout=None):
+        pass
+
+
+def structured_query(address):
+    """
+    Splits a normalized "street, city, state zip" address into a Nominatim
+    structured query, or returns None if the address is not in that form
+    (such as the relaxed "street, zip" queries).
+    """
+    parts = address.split(", ")
+    if len(parts) != 3:
+        return None
+    street, city, state_zip = parts
+    state, _, postalcode = state_zip.partition(" ")
+    query = {"street": street, "city": city, "state": state, "postalcode": postalcode}
+    return {field: value for field, value in query.items() if value}
+
+
+class NominatimBackend(GeocoderBackend):
+    """
+    Geocodes against a Nominatim server, the public one by default.
+    Full addresses are sent as structured queries, which Nominatim matches
+    field by field; anything else goes out as free-form text. Requests go
+    through one requests.Session with a pool of `pool_size` keep-alive
+    connections, so after warm-up each request only pays for the server's
+    own processing time. Connection-level retries are left to RetryPolicy.
+    """
+    name = "nominatim"
+    remote = True
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE, **kwargs):
+        adapter_factory = functools.partial(
+            RequestsAdapter, pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0,
+        )
+        self.geolocator = Nominatim(user_agent="address_mapper", adapter_factory=adapter_factory, **kwargs)
+
+    def geocode(self, query, timeout=None):
+        return self.geolocator.geocode(structured_query(query) or query, timeout=timeout)
+
+
+def local_table_key(address):
+    """
+    Returns the lookup key for an address in the local reference table:
+    the normalized "number street, city, state" with any trailing ZIP dropped.
+    """
+    return re.sub(r"\s+\d{5}(-\d{4})?$", "", normalize_cache_key(address))
+
+
+class LocalTableBackend(GeocoderBackend):
+    """
+    Resolves addresses offline from an OpenAddresses-style CSV. The CSV is
+    loaded once into an indexed SQLite database, which is rebuilt whenever
+    the CSV is newer than it.
+    """
+    name = "local"
+    remote = False
+
+    def __init__(self, table_file=LOCAL_TABLE_FILE, db_file=LOCAL_TABLE_DB):
+        if not Path(table_file).exists():
+            raise FileNotFoundError(f"Local address table '{table_file}' does not exist.")
+        rebuild = (not Path(db_file).exists()
+                   or Path(db_file).stat().st_mtime < Path(table_file).stat().st_mtime)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        # The keys are normalized, so they are stale if the normalizer changed
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if rebuild or version != NORMALIZER_VERSION:
+            self._build(table_file)
+
+    def _build(self, table_file):
+        print(f"Indexing local address table '{table_file}'...")
+        self._conn.execute("DROP TABLE IF EXISTS addresses")
+        self._conn.execute("CREATE TABLE addresses (key TEXT, latitude REAL, longitude REAL)")
+        columns = ["NUMBER", "STREET", "CITY", "REGION", "LAT", "LON"]
+        for chunk in pd.read_csv(table_file, usecols=columns, dtype=str, chunksize=100_000):
+            chunk = chunk.dropna(subset=["STREET", "LAT", "LON"]).fillna("")
+            keys = normalize_addresses(
+                chunk["NUMBER"] + " " + chunk["STREET"] + ", " + chunk["CITY"] + ", " + chunk["REGION"]
+            ).map(local_table_key)
+            self._conn.executemany(
+                "INSERT INTO addresses VALUES (?, ?, ?)",
+                zip(keys, chunk["LAT"].astype(float), chunk["LON"].astype(float)),
+            )
+        self._conn.execute("CREATE INDEX addresses_key ON addresses (key)")
+        self._conn.execute(f"PRAGMA user_version = {NORMALIZER_VERSION}")
+        self._conn.commit()
+
+    def geocode(self, query, timeout=None):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT latitude, longitude FROM addresses WHERE key = ? LIMIT 1",
+                (local_table_key(query),),
+            ).fetchone()
+        return Location(*row) if row else None
+
+
+def make_geocoders(backend=GEOCODER_BACKEND):
+    """
+    Returns the list of geocoder backends named by `backend`, in the order
+    they should be tried.
+    """
+    backends = {"nominatim": NominatimBackend, "local": LocalTableBackend}
+    if GEOCODER_ENDPOINTS:
+        backends["nominatim"] = ShardedNominatimBackend
+    names = backend.split("+")
+    unknown = [name for name in names if name not in backends]
+    if unknown:
+        raise ValueError(f"Unknown geocoder backend(s): {', '.join(unknown)}")
+    return [backends[name]() for name in names]
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter: the wait before retry n is drawn
+    uniformly from [0, min(max_delay, base_delay * 2**n)]. A Retry-After
+    value sent by the server is used as a lower bound. Only timeouts,
+    unreachable servers and rate limiting are retried; other service errors
+    (bad queries, authentication, unparseable responses) are permanent.
+    """
+    RETRYABLE = (GeocoderTimedOut, GeocoderUnavailable, GeocoderRateLimited)
+
+    def __init__(self, max_attempts=RETRY_MAX_ATTEMPTS, base_delay=RETRY_BASE_DELAY,
+                 max_delay=RETRY_MAX_DELAY):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after:
+            delay = max(delay, float(retry_after))
+        return delay
+
+
+class CircuitBreaker:
+    """
+    Tracks the outcome of the last `window` requests across all workers.
+    When the failure rate goes over `failure_rate` the circuit opens and
+    wait() blocks every caller for `cooldown` seconds, so a struggling
+    provider gets a chance to recover instead of absorbing more retries.
+    """
+
+    def __init__(self, window=CIRCUIT_WINDOW, failure_rate=CIRCUIT_FAILURE_RATE,
+                 cooldown=CIRCUIT_COOLDOWN):
+        self.failure_rate = failure_rate
+        self.cooldown = cooldown
+        self._outcomes = deque(maxlen=window)
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, success):
+        with self._lock:
+            self._outcomes.append(success)
+            if len(self._outcomes) < self._outcomes.maxlen:
+                return
+            failures = self._outcomes.count(False)
+            if failures / len(self._outcomes) > self.failure_rate:
+                print(f"{failures} of the last {len(self._outcomes)} requests failed. "
+                      f"Pausing geocoding for {self.cooldown:.0f}s...")
+                self._open_until = time.monotonic() + self.cooldown
+                self._outcomes.clear()
+
+    def wait(self):
+        with self._lock:
+            remaining = self._open_until - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+
+
+def geocode_address(address, geolocator, cache=None, retry=None, breaker=None):
     """
     Attempts to geocode a single address with retry logic.
     Returns a tuple of (latitude, longitude) or (None, None) on failure.
+    If a cache is given it is checked first, and found or not-found results
+    are stored in it. Service errors are never cached. Transient errors are
+    retried according to `retry` (a default RetryPolicy if None), and every
+    request outcome is reported to the optional circuit `breaker`.
     """
-    try:
-        location = geolocator.geocode(address, timeout=10)
-        if location:
-            return (location.latitude, location.longitude)
-        else:
-            print(f"Could not find coordinates for: {address}")
-            return (None, None)
-    except (GeocoderTimedOut, GeocoderServiceError) as e:
-        print(f"Geocoding service error for '{address}': {e}. Retrying...")
-        time.sleep(2)  # Wait and retry
+    return geocode_address_with_status(address, geolocator, cache, retry, breaker)[:2]
+
+
+def geocode_address_with_status(address, geolocator, cache=None, retry=None, breaker=None,
+                                check_cache=True, throttle=None):
+    """
+    Same as geocode_address, but returns a (latitude, longitude, status)
+    tuple where status is one of the STATUS_* codes. With check_cache=False
+    the cache is only written to, for callers that already looked it up.
+    `throttle` is called before every attempt, retries included, and blocks
+    until the request may be sent; if it returns False (the daily quota is
+    used up) the address fails without a request. Requests to remote backends are recorded
+    in METRICS.
+    """
+    remote = getattr(geolocator, "remote", True)
+    if cache is not None and check_cache:
+        cached = cache.get(address)
+        if cached is not None:
+            return (*cached, STATUS_CACHED if cached[0] is not None else STATUS_NOT_FOUND)
+
+    retry = retry or RetryPolicy()
+    for attempt in range(retry.max_attempts):
+        if breaker is not None:
+            breaker.wait()
+        if throttle is not None and not throttle():
+            print(f"Daily quota exhausted. Skipping: {address}")
+            return (None, None, STATUS_FAILED)
+        started = time.monotonic()
         try:
             location = geolocator.geocode(address, timeout=10)
-            if location:
-                return (location.latitude, location.longitude)
-        except (GeocoderTimedOut, GeocoderServiceError):
-            print(f"Failed again for '{address}'. Skipping.")
-            return (None, None)
-    return (None, None)
+        except (GeocoderTimedOut, GeocoderServiceError) as e:
+            if remote:
+                METRICS.observe(time.monotonic() - started)
+                METRICS.count("requests")
+                METRICS.count("timeouts" if isinstance(e, GeocoderTimedOut) else "errors")
+            if not isinstance(e, retry.RETRYABLE):
+                print(f"Geocoding service error for '{address}': {e}. Not retrying.")
+                return (None, None, STATUS_FAILED)
+            if breaker is not None:
+                breaker.record(False)
+            if attempt + 1 == retry.max_attempts:
+                print(f"Geocoding service error for '{address}': {e}. "
+                      f"Giving up after {retry.max_attempts} attempts.")
+                return (None, None, STATUS_FAILED)
+            delay = retry.delay(attempt, getattr(e, "retry_after", None))
+            print(f"Geocoding service error for '{address}': {e}. Retrying in {delay:.1f}s...")
+            if remote:
+                METRICS.count("retries")
+            time.sleep(delay)
+            continue
+
+        if remote:
+            METRICS.observe(time.monotonic() - started)
+            METRICS.count("requests")
+            METRICS.count("found" if location else "not_found")
+        if breaker is not None:
+            breaker.record(True)
+        if location:
+            if cache is not None:
+                cache.set(address, location.latitude, location.longitude)
+            return (location.latitude, location.longitude, STATUS_OK)
+        else:
+            if remote:
+                print(f"Could not find coordinates for: {address}")
+            if cache is not None:
+                cache.set(address, None, None)
+            return (None, None, STATUS_NOT_FOUND)
+    return (None, None, STATUS_FAILED)
+
+
+class TokenBucket:
+    """
+    Asyncio token-bucket rate limiter allowing `rate` acquisitions per second
+    on average, with bursts of up to `burst`.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class DailyQuota:
+    """
+    Counts requests made per UTC day and refuses them once the limit is hit.
+    A limit of None never refuses. The counts are kept in a table of the
+    geocode cache database at `path`, so they carry over between runs.
+    """
+
+    def __init__(self, limit, path=CACHE_FILE, timeout=CACHE_BUSY_TIMEOUT):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS quota (day TEXT PRIMARY KEY, used INTEGER NOT NULL)")
+        self._conn.commit()
+
+    def take(self):
+        """
+        Records one request and returns True, or returns False if today's
+        quota is used up.
+        """
+        today = datetime.now(timezone.utc).date().isoformat()
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO quota VALUES (?, 0)", (today,))
+            # The check and the increment are one statement, so concurrent
+            # runs sharing the database cannot overshoot the limit
+            taken = self._conn.execute(
+                "UPDATE quota SET used = used + 1 WHERE day = ? AND (? IS NULL OR used < ?)",
+                (today, self.limit, self.limit),
+            ).rowcount
+            self._conn.commit()
+        return taken == 1
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CheckpointJournal:
+    """
+    Append-only CSV journal of (address, latitude, longitude, precision)
+    rows for the normalized addresses that were successfully geocoded
+    during a run, at whichever PRECISION_* level they were found.
+    """
+
+    def __init__(self, path=CHECKPOINT_FILE, flush_seconds=CHECKPOINT_FLUSH_SECONDS):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self._file = None
+        self._writer = None
+        self._flushed = time.monotonic()
+
+    def load(self, chunksize=100_000):
+        """
+        Returns a CoordinateIndex of the journaled results keyed on the
+        address_keys() of each address, or None if there is no journal. The
+        journal is read `chunksize` rows at a time.
+        """
+        if not Path(self.path).exists():
+            return None
+
+        def chunks(f):
+            # A run that was killed mid-write can leave a truncated last line
+            rows = (row for row in csv.reader(f)
+                    if len(row) == 4 and row[3] in CoordinateIndex.PRECISIONS)
+            while batch := list(itertools.islice(rows, chunksize)):
+                addresses, latitudes, longitudes, precisions = zip(*batch)
+                yield (address_keys(addresses), np.array(latitudes, dtype=float),
+                       np.array(longitudes, dtype=float), np.array(precisions, dtype=object))
+
+        with open(self.path, newline="") as f:
+            return CoordinateIndex(chunks(f))
+
+    def append(self, addresses, latitudes, longitudes, precision):
+        """
+        Records that each of `addresses` was geocoded at `precision`.
+        """
+        if self._file is None:
+            self._file = open(self.path, "a", newline="")
+            self._writer = csv.writer(self._file)
+        self._writer.writerows(
+            (address, latitude, longitude, precision)
+            for address, latitude, longitude in zip(addresses, latitudes, longitudes)
+        )
+        if time.monotonic() - self._flushed >= self.flush_seconds:
+            self._file.flush()
+            self._flushed = time.monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        self.close()
+        Path(self.path).unlink(missing_ok=True)
+
+
+async def geocode_addresses_async(addresses, geolocator, cache=None,
+                                  concurrency=GEOCODE_CONCURRENCY,
+                                  rate=GEOCODE_RATE_LIMIT,
+                                  quota=None, retry=None, breaker=None,
+                                  check_cache=True):
+    """
+    Geocodes a list of addresses keeping up to `concurrency` requests in
+    flight, while a token bucket holds the request rate to `rate` per second
+    (unlimited if rate is None). Every attempt, retries included, takes a
+    token and counts against the daily `quota`. Cache hits do not count
+    against the rate or the quota, and check_cache=False skips the lookup for callers that already
+    made it. Addresses left over once the daily quota runs out are
+    returned as failed. `retry` and `breaker` are passed on to geocode_address.
+    Returns a list of (latitude, longitude, status) tuples in input order.
+    """
+    loop = asyncio.get_running_loop()
+    bucket = TokenBucket(rate, burst=concurrency) if rate else None
+
+    def throttle():
+        if quota is not None and not quota.take():
+            METRICS.count("quota_exhausted")
+            return False
+        if bucket is not None:
+            # Requests are made from executor threads, which wait on the loop's bucket
+            asyncio.run_coroutine_threadsafe(bucket.acquire(), loop).result()
+        return True
+
+    results = [(None, None, STATUS_FAILED)] * len(addresses)
+    queue = asyncio.Queue()
+    for i, address in enumerate(addresses):
+        queue.put_nowait((i, address))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+
+        async def worker():
+            while not queue.empty():
+                i, address = queue.get_nowait()
+                if cache is not None and check_cache:
+                    cached = cache.get(address)
+                    if cached is not None:
+                        status = STATUS_CACHED if cached[0] is not None else STATUS_NOT_FOUND
+                        results[i] = (*cached, status)
+                        continue
+                results[i] = await loop.run_in_executor(
+                    executor, geocode_address_with_status, address, geolocator, cache, retry, breaker,
+                    False, throttle,
+                )
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    return results
+
+
+def geocode_many(addresses, geolocator, cache=None, **kwargs):
+    """
+    Geocodes a sequence of addresses and returns NumPy arrays
+    (latitudes, longitudes, statuses) aligned with the input. Missing
+    coordinates are NaN and statuses are STATUS_* codes. Each distinct
+    address is only looked up once, cache hits are answered with one bulk
+    query, and only the misses go to geocode_addresses_async (which receives
+    the remaining keyword arguments), or to the backend's own
+    geocode_batch() if it has one.
+    """
+    codes, uniques = pd.factorize(np.asarray(addresses, dtype=object))
+    # One extra slot at the end for missing addresses, which factorize codes as -1
+    latitudes = np.full(len(uniques) + 1, np.nan)
+    longitudes = np.full(len(uniques) + 1, np.nan)
+    statuses = np.full(len(uniques) + 1, STATUS_FAILED, dtype=np.int8)
+
+    todo = np.arange(len(uniques))
+    if cache is not None and len(uniques):
+        hits = cache.get_many(uniques)
+        hit = np.fromiter((h is not None for h in hits), dtype=bool, count=len(hits))
+        found = np.array([h for h in hits if h is not None], dtype=float).reshape(-1, 2)
+        latitudes[:-1][hit] = found[:, 0]
+        longitudes[:-1][hit] = found[:, 1]
+        statuses[:-1][hit] = np.where(np.isnan(found[:, 0]), STATUS_NOT_FOUND, STATUS_CACHED)
+        todo = todo[~hit]
+
+    if len(todo):
+        if hasattr(geolocator, "geocode_batch"):
+            results = geolocator.geocode_batch(uniques[todo].tolist(), cache, **kwargs)
+        else:
+            results = asyncio.run(geocode_addresses_async(
+                uniques[todo].tolist(), geolocator, cache, check_cache=cache is None, **kwargs
+            ))
+        results = np.array(results, dtype=float).reshape(-1, 3)
+        latitudes[todo] = results[:, 0]
+        longitudes[todo] = results[:, 1]
+        statuses[todo] = results[:, 2]
+
+    return latitudes[codes], longitudes[codes], statuses[codes]
+
+
+class HashRing:
+    """
+    Consistent hash ring mapping keys onto nodes. Each node is placed at
+    `replicas` points on the ring so keys spread evenly, and adding or
+    removing a node only moves the keys next to its points.
+    """
+
+    def __init__(self, nodes, replicas=100):
+        self.nodes = list(nodes)
+        points = sorted(
+            (self._hash(f"{node}#{i}"), n)
+            for n, node in enumerate(self.nodes) for i in range(replicas)
+        )
+        self._hashes = [h for h, _ in points]
+        self._owners = [n for _, n in points]
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def node_index(self, key):
+        """
+        Returns the index in `nodes` of the node that owns `key`.
+        """
+        i = bisect.bisect(self._hashes, self._hash(key)) % len(self._hashes)
+        return self._owners[i]
+
+
+def _geocode_shard(endpoint, addresses, concurrency, rate):
+    """
+    Worker process entry point: geocodes one shard of addresses against a
+    single Nominatim endpoint with its own retry policy and circuit breaker.
+    Workers do not touch the geocode cache; the parent process writes their
+    results to it. Returns the results along with the worker's METRICS state.
+    """
+    METRICS.reset()
+    url = urlsplit(endpoint)
+    geolocator = NominatimBackend(domain=url.netloc + url.path.rstrip("/"), scheme=url.scheme or "https")
+    results = asyncio.run(geocode_addresses_async(
+        addresses, geolocator, concurrency=concurrency, rate=rate,
+        retry=RetryPolicy(), breaker=CircuitBreaker(), check_cache=False,
+    ))
+    return results, METRICS.state()
+
+
+class ShardedNominatimBackend(GeocoderBackend):
+    """
+    Spreads geocoding across several Nominatim replicas. Addresses are
+    consistent-hashed onto GEOCODER_ENDPOINTS, so an address always goes to
+    the same replica and each replica's own cache stays warm for its shard.
+    Batches are processed by a pool of GEOCODER_WORKERS_PER_ENDPOINT worker
+    processes per endpoint.
+    """
+    name = "nominatim"
+    remote = True
+
+    def __init__(self, endpoints=None, workers_per_endpoint=GEOCODER_WORKERS_PER_ENDPOINT):
+        self.endpoints = list(endpoints or GEOCODER_ENDPOINTS)
+        self.workers_per_endpoint = workers_per_endpoint
+        self.ring = HashRing(self.endpoints)
+        self._geolocators = {}
+
+    def geocode(self, query, timeout=None):
+        endpoint = self.endpoints[self.ring.node_index(normalize_cache_key(query))]
+        if endpoint not in self._geolocators:
+            url = urlsplit(endpoint)
+            self._geolocators[endpoint] = NominatimBackend(
+                domain=url.netloc + url.path.rstrip("/"), scheme=url.scheme or "https"
+            )
+        return self._geolocators[endpoint].geocode(query, timeout=timeout)
+
+    def geocode_batch(self, addresses, cache=None, concurrency=GEOCODE_CONCURRENCY,
+                      rate=GEOCODE_RATE_LIMIT, **kwargs):
+        """
+        Geocodes `addresses` across the worker pool and returns a list of
+        (latitude, longitude, status) tuples in input order. Each endpoint's
+        `concurrency` and `rate` are split evenly between its workers.
+        Found and not-found results are written to `cache` as each shard
+        finishes. Other keyword arguments (quota, retry, breaker) are not shared
+        across processes and are ignored.
+        """
+        workers = self.workers_per_endpoint
+        groups = {}
+        for i, address in enumerate(addresses):
+            node = self.ring.node_index(normalize_cache_key(address))
+            groups.setdefault((node, i % workers), []).append(i)
+
+        results = [(None, None, STATUS_FAILED)] * len(addresses)
+        with ProcessPoolExecutor(max_workers=len(self.endpoints) * workers) as pool:
+            futures = {
+                pool.submit(
+                    _geocode_shard, self.endpoints[node], [addresses[i] for i in indices],
+                    max(1, concurrency // workers), rate / workers if rate else None,
+                ): indices
+                for (node, _), indices in groups.items()
+            }
+            for future in as_completed(futures):
+                indices = futures[future]
+                shard_results, shard_metrics = future.result()
+                METRICS.merge(shard_metrics)
+                for i, result in zip(indices, shard_results):
+                    results[i] = result
+                if cache is not None:
+                    cache.set_many(
+                        (addresses[i], *result[:2])
+                        for i, result in zip(indices, shard_results)
+                        if result[2] in (STATUS_OK, STATUS_NOT_FOUND)
+                    )
+        return results
+
+
+def hash_rows(df):
+    """
+    Returns a Series of 64-bit content hashes of the ROW_KEY_COLUMNS of each row.
+    """
+    return pd.util.hash_pandas_object(df[ROW_KEY_COLUMNS].fillna(""), index=False)
+
+
+def address_keys(addresses):
+    """
+    Returns a uint64 array of 64-bit hashes of a sequence of address strings.
+    """
+    return pd.util.hash_array(np.asarray(addresses, dtype=object))
+
+
+class CoordinateIndex:
+    """
+    Read-only map from 64-bit keys to (latitude, longitude, precision), held
+    in sorted NumPy arrays at 25 bytes per entry. It is built from chunks,
+    so the source never has to be in memory as a whole.
+    """
+    PRECISIONS = (PRECISION_ADDRESS, PRECISION_STREET_ZIP, PRECISION_ZIP)
+
+    def __init__(self, chunks):
+        """
+        `chunks` yields (keys, latitudes, longitudes, precisions) arrays.
+        Entries without coordinates are dropped, and the first of any
+        duplicate keys wins.
+        """
+        parts = [(np.empty(0, dtype=np.uint64), np.empty(0), np.empty(0), np.empty(0, dtype=np.int8))]
+        for keys, latitudes, longitudes, precisions in chunks:
+            found = ~(np.isnan(latitudes) | np.isnan(longitudes))
+            # Unknown precision levels are coded -1 and read back as None
+            codes = pd.Categorical(precisions[found], categories=self.PRECISIONS).codes
+            parts.append((np.asarray(keys, dtype=np.uint64)[found], latitudes[found],
+                          longitudes[found], codes.astype(np.int8)))
+        keys, latitudes, longitudes, codes = (np.concatenate(column) for column in zip(*parts))
+        self._keys, first = np.unique(keys, return_index=True)
+        self._latitudes = latitudes[first]
+        self._longitudes = longitudes[first]
+        self._codes = codes[first]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def lookup(self, keys):
+        """
+        Returns (latitudes, longitudes, precisions) arrays aligned with
+        `keys`, holding NaN and None for keys that are not in the index.
+        """
+        keys = np.asarray(keys, dtype=np.uint64)
+        latitudes = np.full(len(keys), np.nan)
+        longitudes = np.full(len(keys), np.nan)
+        codes = np.full(len(keys), -1, dtype=np.int8)
+        if len(self._keys):
+            i = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+            found = self._keys[i] == keys
+            latitudes[found] = self._latitudes[i[found]]
+            longitudes[found] = self._longitudes[i[found]]
+            codes[found] = self._codes[i[found]]
+        return latitudes, longitudes, np.array(self.PRECISIONS + (None,), dtype=object)[codes]
+
+
+def geoparquet_table(df, schema=None):
+    """
+    Converts a chunk of geocoded rows to an Arrow table with string columns,
+    float64 latitude/longitude and a WKB point `geometry` column, carrying
+    GeoParquet metadata. Pass the schema of the first chunk to later ones so
+    that every row group has the same types.
+    """
+    latitudes = df["latitude"].to_numpy(dtype=float)
+    longitudes = df["longitude"].to_numpy(dtype=float)
+    valid = ~(np.isnan(latitudes) | np.isnan(longitudes))
+    geometry = np.full(len(df), None, dtype=object)
+    geometry[valid] = shapely.to_wkb(shapely.points(longitudes[valid], latitudes[valid]))
+
+    if schema is None:
+        fields = [pa.field(col, pa.float64() if col in ("latitude", "longitude") else pa.string())
+                  for col in df.columns]
+        fields.append(pa.field("geometry", pa.binary()))
+        geo = {
+            "version": "1.1.0",
+            "primary_column": "geometry",
+            "columns": {"geometry": {"encoding": "WKB", "geometry_types": ["Point"]}},
+        }
+        schema = pa.schema(fields, metadata={"geo": json.dumps(geo)})
+
+    arrays = [pa.array(df[field.name], type=field.type, from_pandas=True) for field in schema
+              if field.name != "geometry"]
+    arrays.append(pa.array(geometry, type=pa.binary()))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+class GeocodedWriter:
+    """
+    Streams chunks of geocoded rows into GEOCODED_FILE. The output is built
+    under a temporary name and only replaces the existing file on commit(),
+    so an interrupted run never leaves a half-written file behind.
+    """
+
+    def __init__(self, path=GEOCODED_FILE, partition_by_state=PARTITION_BY_STATE):
+        self.path = Path(path)
+        self.tmp_path = Path(str(path) + ".tmp")
+        self.partition_by_state = partition_by_state
+        self.schema = None
+        self._writer = None
+        self._chunks = 0
+        self._remove(self.tmp_path)
+
+    @staticmethod
+    def _remove(path):
+        if path.is_dir():
+            shutil.rmtree(path)
+        else:
+            path.unlink(missing_ok=True)
+
+    def write(self, df):
+        table = geoparquet_table(df, self.schema)
+        self.schema = table.schema
+        if self.partition_by_state:
+            pq.write_to_dataset(
+                table, self.tmp_path, partition_cols=["state_abbr"],
+                basename_template=f"part-{self._chunks}-{{i}}.parquet",
+                compression=PARQUET_COMPRESSION,
+            )
+        else:
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.tmp_path, self.schema, compression=PARQUET_COMPRESSION)
+            self._writer.write_table(table)
+        self._chunks += 1
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def commit(self):
+        self.close()
+        self._remove(self.path)
+        self.tmp_path.replace(self.path)
+
+
+def read_geocoded(columns=None, path=GEOCODED_FILE):
+    """
+    Reads the geocoded output into a DataFrame, loading only `columns` (all
+    of them by default). Requested columns the file does not have are
+    skipped.
+    """
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+    if columns is not None:
+        columns = [col for col in columns if col in dataset.schema.names]
+    df = dataset.to_table(columns=columns).to_pandas()
+    # Hive partition values come back as categoricals
+    if "state_abbr" in df and isinstance(df["state_abbr"].dtype, pd.CategoricalDtype):
+        df["state_abbr"] = df["state_abbr"].astype(str)
+    return df
+
+
+def load_previous_geocodes(batch_size=100_000):
+    """
+    Returns a CoordinateIndex of the successfully geocoded rows in
+    GEOCODED_FILE keyed on their row hash. The file is streamed
+    `batch_size` rows at a time, so only the index is held in memory.
+    Files written before precision was recorded count as address-level.
+    """
+    dataset = ds.dataset(GEOCODED_FILE, format="parquet", partitioning="hive")
+    columns = [col for col in ROW_KEY_COLUMNS + ['latitude', 'longitude', 'precision']
+               if col in dataset.schema.names]
+
+    def chunks():
+        for batch in dataset.to_batches(columns=columns, batch_size=batch_size):
+            df = batch.to_pandas()
+            # Hive partition values come back as categoricals
+            if "state_abbr" in df and isinstance(df["state_abbr"].dtype, pd.CategoricalDtype):
+                df["state_abbr"] = df["state_abbr"].astype(str)
+            precisions = (df["precision"].to_numpy(dtype=object) if "precision" in df
+                          else np.full(len(df), PRECISION_ADDRESS, dtype=object))
+            yield (hash_rows(df).to_numpy(), df["latitude"].to_numpy(dtype=float),
+                   df["longitude"].to_numpy(dtype=float), precisions)
 
+    return CoordinateIndex(chunks())
 
-def do_geocoding():
-    # --- 1. Read CSV file from data.csv ---
-    df = pd.read_csv(INPUT_FILE)
+
+@functools.lru_cache(maxsize=None)
+def load_zip_centroids(path=ZIP_CENTROIDS_FILE):
+    """
+    Returns a DataFrame of ZIP5 centroid latitude and longitude indexed by
+    zip, or None if the centroid table does not exist. It is only read once.
+    """
+    if not Path(path).exists():
+        print(f"ZIP centroid table '{path}' not found. Rows that cannot be geocoded "
+              f"will not fall back to their ZIP centroid (see the README).")
+        return None
+    centroids = pd.read_csv(path, usecols=["zip", "latitude", "longitude"], dtype={"zip": str})
+    centroids["zip"] = centroids["zip"].str.zfill(5)
+    return centroids.drop_duplicates("zip").set_index("zip")
+
+
+def temporary_path(path):
+    """
+    Returns a new, uniquely named empty file next to `path`, to be written
+    and then moved over `path` with Path.replace(). Processes writing the
+    same file concurrently each get their own.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=f"{path.name}.", suffix=".tmp",
+                                     delete=False) as f:
+        return Path(f.name)
+
+
+def load_boundary(path=BOUNDARY_FILE, crs=None, tolerance=None, cache_dir=BOUNDARY_CACHE_DIR):
+    """
+    Returns the boundary in `path` as a GeoDataFrame, reprojected to `crs`
+    and simplified to `tolerance` (in units of that crs) if given. The
+    result is cached in cache_dir and reused until the source file changes.
+    """
+    options = json.dumps([cached_file_sha256(path), str(crs), tolerance])
+    key = hashlib.sha256(options.encode()).hexdigest()[:16]
+    cache_file = Path(cache_dir) / f"{Path(path).stem}-{key}.feather"
+    if cache_file.exists():
+        table = pa.feather.read_table(cache_file)
+        geometry = shapely.from_wkb(table.column("geometry").to_numpy(zero_copy_only=False))
+        attributes = table.drop_columns(["geometry"]).to_pandas()
+        crs = (table.schema.metadata or {}).get(b"crs")
+        return gpd.GeoDataFrame(attributes, geometry=geometry, crs=crs and crs.decode())
+
+    boundary = gpd.read_file(path)
+    if crs is not None:
+        boundary = boundary.to_crs(crs)
+    if tolerance:
+        boundary["geometry"] = boundary.geometry.simplify(tolerance, preserve_topology=True)
+
+    # Store the geometry as plain WKB and the CRS as a short string, both of
+    # which are much faster to load than a full GeoArrow/PROJJSON round trip.
+    table = pa.Table.from_pandas(pd.DataFrame(boundary.drop(columns=boundary.geometry.name)),
+                                 preserve_index=False)
+    table = table.append_column("geometry", pa.array(shapely.to_wkb(boundary.geometry.values),
+                                                     type=pa.binary()))
+    if boundary.crs is not None:
+        table = table.replace_schema_metadata({"crs": boundary.crs.to_string()})
+    tmp_file = temporary_path(cache_file)
+    pa.feather.write_feather(table, tmp_file, compression="zstd")
+    tmp_file.replace(cache_file)
+    return boundary
+
+
+@functools.lru_cache(maxsize=None)
+def load_region(path=BOUNDARY_FILE, tolerance=REGION_TOLERANCE_DEGREES):
+    """
+    Returns the union of the boundary geometries in `path`, in lon/lat and
+    grown by `tolerance` degrees, prepared for fast repeated point-in-polygon
+    tests. It is only built once per path.
+    """
+    boundary = load_boundary(path, crs="EPSG:4326")
+    region = shapely.union_all(boundary.geometry.values)
+    if tolerance:
+        region = region.buffer(tolerance)
+    shapely.prepare(region)
+    return region
+
+
+def in_region(latitudes, longitudes, region=None):
+    """
+    Vectorized point-in-polygon test of coordinate arrays against the
+    boundary region. Returns a boolean array that is False for points
+    outside the region and for missing coordinates.
+    """
+    region = region if region is not None else load_region()
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    inside = np.zeros(len(latitudes), dtype=bool)
+    valid = ~(np.isnan(latitudes) | np.isnan(longitudes))
+    inside[valid] = shapely.contains_xy(region, longitudes[valid], latitudes[valid])
+    return inside
+
+
+def reject_out_of_region(latitudes, longitudes, rows):
+    """
+    Clears the coordinates at `rows` that fall outside the boundary region,
+    so they are picked up again by the next backend or fallback tier.
+    """
+    if not VALIDATE_REGION or not len(rows):
+        return
+    found = rows[~np.isnan(latitudes[rows])]
+    outside = found[~in_region(latitudes[found], longitudes[found])]
+    if len(outside):
+        METRICS.count("out_of_region", len(outside))
+        latitudes[outside] = np.nan
+        longitudes[outside] = np.nan
+
+
+def geocode_chunk(df, geocoders, previous=None, journaled=None, journal=None, **kwargs):
+    """
+    Adds full_address, latitude, longitude and precision columns to a chunk
+    of input rows. Addresses are normalized before they are looked up or
+    geocoded. Coordinates are taken from `previous` (unchanged rows) and
+    `journaled` (an interrupted run) where possible and the rest are
+    geocoded with geocode_many using each of `geocoders` in turn, first by
+    full address, then by street and ZIP, and finally from the ZIP centroid
+    table. Only addresses that were not found (or were placed outside the
+    region) fall through to the coarser levels; addresses that failed with
+    a service error are left missing so a later run retries them.
+    Rows found by the geocoders are recorded in the checkpoint `journal`
+    under their normalized address and precision as each tier finishes.
+    Remaining keyword arguments (cache, quota, retry, breaker) are passed
+    on to geocode_many for remote backends. Returns the number of rows that
+    were unchanged since the last run.
+    """
     df["full_address"] = df["address"] + ', ' + df["city"] + ", " + df["state_abbr"] + " " + df["zip"]
+    df["latitude"] = float("nan")
+    df["longitude"] = float("nan")
+    df["precision"] = None
+    if df.empty:
+        return 0
+
+    # Reuse coordinates for rows that have not changed
+    if previous is not None:
+        df["latitude"], df["longitude"], df["precision"] = previous.lookup(hash_rows(df).to_numpy())
+    unchanged = int(df["latitude"].notna().sum())
+
+    normalized = normalize_addresses(df["full_address"])
+
+    # Pick up where an interrupted run stopped
+    todo = df["latitude"].isna()
+    resumable = (todo & normalized.notna()).to_numpy()
+    if journaled is not None and resumable.any():
+        latitudes, longitudes, precisions = journaled.lookup(address_keys(normalized[resumable]))
+        df.loc[resumable, "latitude"] = latitudes
+        df.loc[resumable, "longitude"] = longitudes
+        df.loc[resumable, "precision"] = precisions
+
+    # Geocode the remaining addresses, passing whatever one backend misses on
+    # (or places outside the region) to the next and relaxing the query when
+    # all of them miss. geocode_many only looks up each distinct address once.
+    # Rows that failed (service errors, an open circuit, the daily quota) are
+    # not relaxed, or a coarse fallback would be kept as if it were final.
+    latitudes = df["latitude"].to_numpy(dtype=float, copy=True)
+    longitudes = df["longitude"].to_numpy(dtype=float, copy=True)
+    reject_out_of_region(latitudes, longitudes, np.flatnonzero(todo.to_numpy()))
+    precision = df["precision"].to_numpy(dtype=object, copy=True)
+    precision[np.isnan(latitudes)] = None
+    failed = np.zeros(len(df), dtype=bool)
+    zip5 = df["zip"].str[:5]
+    street_zip = normalized.str.split(", ").str[0] + ", " + zip5
+    addresses = normalized.to_numpy(dtype=object)
+    tiers = [
+        (PRECISION_ADDRESS, addresses),
+        (PRECISION_STREET_ZIP, street_zip.to_numpy(dtype=object)),
+    ]
+    for level, queries in tiers:
+        skip = failed.copy()
+        for geolocator in geocoders:
+            todo = np.flatnonzero(np.isnan(latitudes) & ~skip)
+            if not len(todo):
+                break
+            if geolocator.remote:
+                lat, lon, status = geocode_many(queries[todo], geolocator, **kwargs)
+            else:
+                lat, lon, status = geocode_many(queries[todo], geolocator, concurrency=1, rate=None)
+            failed[todo] |= status == STATUS_FAILED
+            latitudes[todo] = lat
+            longitudes[todo] = lon
+            reject_out_of_region(latitudes, longitudes, todo)
+            found = todo[~np.isnan(latitudes[todo])]
+            precision[found] = level
+            if journal is not None:
+                journal.append(addresses[found], latitudes[found], longitudes[found], level)
+
+    # Last resort: the centroid of the row's ZIP code
+    todo = np.isnan(latitudes) & ~failed
+    centroids = load_zip_centroids() if todo.any() else None
+    if centroids is not None:
+        lat = zip5[todo].map(centroids["latitude"]).to_numpy(dtype=float)
+        lon = zip5[todo].map(centroids["longitude"]).to_numpy(dtype=float)
+        todo = np.flatnonzero(todo)
+        latitudes[todo] = lat
+        longitudes[todo] = lon
+        reject_out_of_region(latitudes, longitudes, todo)
+        precision[todo[~np.isnan(latitudes[todo])]] = PRECISION_ZIP
+
+    df["latitude"] = latitudes
+    df["longitude"] = longitudes
+    df["precision"] = precision
+
+    return unchanged
+
+
+def file_sha256(path):
+    """
+    Returns the hex SHA-256 digest of a file's contents.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cached_file_sha256(path, index_file=FILE_HASH_INDEX):
+    """
+    Returns file_sha256(path), remembered in index_file against the file's
+    size and modification time so an unchanged file is not read again.
+    """
+    index_file = Path(index_file)
+    try:
+        index = json.loads(index_file.read_text())
+    except (OSError, ValueError):
+        index = {}
+
+    stat = Path(path).stat()
+    key = str(Path(path).resolve())
+    entry = index.get(key)
+    if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+        return entry["sha256"]
+
+    digest = file_sha256(path)
+    index[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+    tmp_file = temporary_path(index_file)
+    tmp_file.write_text(json.dumps(index, indent=2))
+    tmp_file.replace(index_file)
+    return digest
+
+
+def geocoding_manifest():
+    """
+    Returns the manifest describing what geocoding INPUT_FILE with the
+    current configuration would produce. Reference tables are recorded by
+    content hash, so editing one in place invalidates the output.
+    """
+    backends = GEOCODER_BACKEND.split("+")
+    return {
+        "input_sha256": file_sha256(INPUT_FILE),
+        "normalizer_version": NORMALIZER_VERSION,
+        "geocoder": {
+            "backend": GEOCODER_BACKEND,
+            "endpoints": sorted(GEOCODER_ENDPOINTS) if "nominatim" in backends else None,
+            "local_table_sha256": cached_file_sha256(LOCAL_TABLE_FILE) if "local" in backends else None,
+            "zip_centroids_sha256": (cached_file_sha256(ZIP_CENTROIDS_FILE)
+                                     if Path(ZIP_CENTROIDS_FILE).exists() else None),
+            "boundary_sha256": cached_file_sha256(BOUNDARY_FILE) if VALIDATE_REGION else None,
+            "region_tolerance": REGION_TOLERANCE_DEGREES if VALIDATE_REGION else None,
+        },
+    }
+
+
+def read_manifest():
+    """
+    Returns the manifest stored alongside GEOCODED_FILE, or None if there
+    is no geocoded output or it has no manifest.
+    """
+    if not Path(GEOCODED_FILE).exists() or not Path(MANIFEST_FILE).exists():
+        return None
+    with open(MANIFEST_FILE) as f:
+        return json.load(f)
 
-    # --- 2. Geocode the addresses ---
+
+def do_geocoding(incremental=False, resume=True, chunksize=INPUT_CHUNKSIZE):
+    """
+    Geocodes every row of INPUT_FILE and writes the result to GEOCODED_FILE.
+    With incremental=True, rows that are unchanged since the last run reuse
+    the coordinates already in GEOCODED_FILE and only new or changed rows are
+    geocoded. Rows removed from the input are dropped from the output.
+    With resume=True, addresses recorded in the checkpoint journal by an
+    interrupted run are not geocoded again.
+    The input is streamed `chunksize` rows at a time (all at once if None)
+    and each chunk is appended to the output as soon as it is geocoded. The
+    previous output and the journal are streamed into CoordinateIndex
+    lookups, so beyond one chunk memory grows by about 25 bytes per
+    previously geocoded row.
+    """
+    manifest = geocoding_manifest()
+
+    # --- 1. Load what earlier runs already geocoded ---
+    previous = None
+    if incremental and Path(GEOCODED_FILE).exists():
+        previous = load_previous_geocodes()
+
+    journal = CheckpointJournal()
+    if not resume:
+        journal.remove()
+    journaled = journal.load()
+    if journaled is not None and len(journaled):
+        print(f"Resuming from {len(journaled)} results in '{journal.path}'.")
+
+    # --- 2. Geocode the addresses chunk by chunk ---
     print("Geocoding addresses...")
-    geolocator = Nominatim(user_agent="address_mapper")
-    
-    # Apply the geocoding function to each address in the DataFrame
-    df[['latitude', 'longitude']] = df['full_address'].apply(
-        lambda x: pd.Series(geocode_address(x, geolocator))
-    )
+    METRICS.reset()
+    geocoders = make_geocoders()
+    cache = GeocodeCache()
+    quota = DailyQuota(GEOCODE_DAILY_QUOTA)
+    retry = RetryPolicy()
+    breaker = CircuitBreaker()
 
-    # Save it out to a file for later use
-    df.to_csv(GEOCODED_FILE, index=False)
+    # GEOCODED_FILE stays intact (and readable for incremental runs) until
+    # the new output is complete
+    writer = GeocodedWriter()
+    total = unchanged = 0
+    failed = []
+    precision_counts = pd.Series(dtype=int)
+    chunks = pd.read_csv(INPUT_FILE, dtype=str, chunksize=chunksize)
+    if chunksize is None:
+        chunks = [chunks]
+    try:
+        for df in chunks:
+            unchanged += geocode_chunk(
+                df, geocoders, previous, journaled,
+                cache=cache, quota=quota, retry=retry, breaker=breaker, journal=journal,
+            )
+            total += len(df)
+
+            # --- 3. Save it out to a file for later use ---
+            writer.write(df)
+            failed.append(df[df[['latitude', 'longitude']].isna().any(axis=1)])
+            precision_counts = precision_counts.add(df["precision"].value_counts(), fill_value=0)
+            if chunksize is not None:
+                print(f"Geocoded {total} rows...")
+    finally:
+        writer.close()
+        journal.close()
+        cache.close()
+        quota.close()
+
+    writer.commit()
+    with open(MANIFEST_FILE, "w") as f:
+        json.dump(manifest, f, indent=2)
+    journal.remove()
+    if previous is not None:
+        print(f"{unchanged} of {total} rows unchanged since the last run.")
+
+    # Report where the time went
+    METRICS.write_json(METRICS_FILE)
+    if PROMETHEUS_FILE:
+        METRICS.write_prometheus(PROMETHEUS_FILE)
+    summary = METRICS.summary()
+    print(f"Made {summary['requests']} geocoding requests in {summary['elapsed_seconds']}s "
+          f"({summary['cache_hits'] + summary['cache_negative_hits']} cache hits). "
+          f"Metrics saved to '{METRICS_FILE}'.")
 
-    # Filter out rows where geocoding failed
-    df_valid = df.dropna(subset=['latitude', 'longitude']).reset_index(drop=True)
+    # Report how precisely rows were geocoded and which ones were not
+    for level, count in precision_counts.items():
+        print(f"{int(count)} rows geocoded at {level} precision.")
+    failed = pd.concat(failed) if failed else pd.DataFrame()
+    if len(failed):
+        print(f"Could not geocode {len(failed)} out of {total} addresses:")
+        print(failed[['inst_name', 'full_address']].to_string(index=False))
 
-    if len(df_valid) != len(df):
 
-        raise ValueError(
-            f"Successfully geocoded {len(df_valid)} out of {len(df)} addresses."
-            f"Failed on {df[df.isna(subset=['latitude', 'longitude'])]}"
+def categorical_palette(n):
+    """
+    Returns an (n, 4) array of distinct RGBA colors: BASE_COLORS first, then
+    hues spaced by the golden ratio so neighbouring categories stay apart,
+    cycling through a few saturation/brightness levels.
+    """
+    colors = [mcolors.to_rgba(color) for color in BASE_COLORS[:n]]
+    extra = np.arange(max(n - len(colors), 0))
+    hsv = np.column_stack([
+        (0.1 + extra * 0.618033988749895) % 1.0,
+        np.array([0.85, 0.6, 0.95])[extra % 3],
+        np.array([0.9, 0.7, 0.55])[(extra // 3) % 3],
+    ])
+    generated = np.column_stack([mcolors.hsv_to_rgb(hsv), np.ones(len(extra))])
+    return np.vstack([np.reshape(colors, (-1, 4)), generated])
+
+
+def plot_points(ax, df, size=MARKER_SIZE, cluster_radius=CLUSTER_RADIUS_PX, dpi=MAP_DPI,
+                names=None):
+    """
+    Draws all the points in a single scatter call, colored by inst_name, and
+    returns proxy legend handles with one entry per institution. With a
+    cluster_radius (in output pixels), points that would overlap are drawn
+    as cluster markers instead. Pass the full list of institution `names`
+    to keep colors consistent when df is only part of the data.
+    """
+    if names is None:
+        codes, names = pd.factorize(df["inst_name"], use_na_sentinel=False)
+    else:
+        codes = pd.Index(names).get_indexer(df["inst_name"])
+    palette = categorical_palette(len(names))
+    handles = [
+        Line2D([], [], linestyle="", marker='o', markersize=np.sqrt(size),
+               color=color, label=str(name))
+        for name, color in zip(names, palette)
+    ]
+
+    projected = ax.projection.transform_points(
+        ccrs.PlateCarree(), df["longitude"].to_numpy(), df["latitude"].to_numpy()
+    )
+    valid = np.isfinite(projected[:, :2]).all(axis=1)
+    x, y, codes = projected[valid, 0], projected[valid, 1], codes[valid]
+
+    if cluster_radius:
+        width, height = axes_pixel_size(ax, dpi)
+        labels, cluster_x, cluster_y, counts = cluster_points(
+            x, y, ax.get_extent(), (height, width), cluster_radius
         )
+        single = counts[labels] == 1
+        clustered = counts > 1
+        if clustered.any():
+            plot_clusters(ax, cluster_x[clustered], cluster_y[clustered], counts[clustered], size)
+            handles.append(Line2D([], [], linestyle="", marker='o', markersize=np.sqrt(size),
+                                  color=CLUSTER_COLOR, label="Several institutions (count shown)"))
+        x, y, codes = x[single], y[single], codes[single]
 
+    ax.scatter(x, y, transform=ax.projection, c=palette[codes], marker='o', s=size)
+    return handles
 
-def create_map_from_csv():
+
+def plot_clusters(ax, x, y, counts, size=MARKER_SIZE):
     """
-    Main function to read addresses from a CSV, geocode, and plot them on a map.
+    Draws one marker per cluster, growing with the log of its count, with
+    the count written on it.
     """
-    # See if the data has already been geocoded
-    if not Path(GEOCODED_FILE).exists():
-        do_geocoding()
+    ax.scatter(x, y, transform=ax.projection, color=CLUSTER_COLOR, edgecolor="white",
+               marker='o', s=size * (1 + np.log2(counts)), zorder=4)
+    for cx, cy, count in zip(x, y, counts):
+        ax.text(cx, cy, str(count), transform=ax.projection, ha="center", va="center",
+                color="white", fontsize=7, fontweight="bold", zorder=5)
 
-    # Read in geocoded data
-    df = pd.read_csv(GEOCODED_FILE)
-    
-    if df.empty:
-        print("No valid addresses to plot. Exiting.")
+
+def add_legend(ax, handles, table_file=LEGEND_TABLE_FILE):
+    """
+    Places the legend below the map, or writes it to table_file if there are
+    too many entries to draw.
+    """
+    if len(handles) <= LEGEND_MAX_ENTRIES:
+        ax.legend(handles=handles, bbox_to_anchor=(0.015, -0.45), loc='lower left',
+                  ncol=2, fontsize=11)
         return
 
-    # Create the map using Cartopy and Matplotlib
-    fig = plt.figure(figsize=(10, 12))
+    with open(table_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["inst_name", "color"])
+        for handle in handles:
+            writer.writerow([handle.get_label(), mcolors.to_hex(handle.get_color())])
+    print(f"{len(handles)} legend entries written to '{table_file}'")
+
+
+def axes_pixel_size(ax, dpi=MAP_DPI):
+    """
+    Returns the (width, height) in pixels of the axes when the figure is
+    saved at dpi.
+    """
+    ax.apply_aspect()
+    bbox = ax.get_window_extent()
+    scale = dpi / ax.figure.dpi
+    return max(int(round(bbox.width * scale)), 1), max(int(round(bbox.height * scale)), 1)
+
+
+def bin_points(x, y, extent, shape):
+    """
+    Counts the points falling in each cell of a (height, width) grid covering
+    extent (x0, x1, y0, y1). Row 0 is the bottom of the extent.
+    """
+    x0, x1, y0, y1 = extent
+    height, width = shape
+    col = np.floor((x - x0) / (x1 - x0) * width)
+    row = np.floor((y - y0) / (y1 - y0) * height)
+    inside = (col >= 0) & (col < width) & (row >= 0) & (row < height)
+    cells = row[inside].astype(np.int64) * width + col[inside].astype(np.int64)
+    return np.bincount(cells, minlength=width * height).reshape(height, width)
+
+
+def cluster_points(x, y, extent, shape, radius_px=CLUSTER_RADIUS_PX):
+    """
+    Clusters points that are within about radius_px of each other when
+    extent (x0, x1, y0, y1) is rendered at shape (height, width) pixels.
+    Points are first hashed into a grid of radius_px cells, then each cell
+    is merged into its most populated neighbouring cell whose center is
+    within radius_px, unless that cell is itself merged into another.
+    Merging only one step keeps dense areas from chaining into one huge
+    cluster. Returns the cluster label of each point and the center and
+    size of each cluster.
+    """
+    x0, x1, y0, y1 = extent
+    height, width = shape
+    scale_x = width / (x1 - x0)
+    scale_y = height / (y1 - y0)
+    col = np.floor((x - x0) * scale_x / radius_px).astype(np.int64)
+    row = np.floor((y - y0) * scale_y / radius_px).astype(np.int64)
+    col -= col.min(initial=0)
+    row -= row.min(initial=0)
+    stride = row.max(initial=0) + 2
+    keys, labels, counts = np.unique(col * stride + row + 1, return_inverse=True, return_counts=True)
+    labels = labels.ravel()
+    center_x = np.bincount(labels, weights=x, minlength=len(keys)) / counts
+    center_y = np.bincount(labels, weights=y, minlength=len(keys)) / counts
+
+    # Find the pairs of neighbouring cells whose centers would overlap
+    sources, targets = [], []
+    for offset in (stride, 1, stride + 1, stride - 1):
+        neighbor = np.searchsorted(keys, keys + offset)
+        found = neighbor < len(keys)
+        found[found] = keys[neighbor[found]] == keys[found] + offset
+        a, b = np.nonzero(found)[0], neighbor[found]
+        close = np.hypot((center_x[a] - center_x[b]) * scale_x,
+                         (center_y[a] - center_y[b]) * scale_y) < radius_px
+        sources += [a[close], b[close]]
+        targets += [b[close], a[close]]
+    sources = np.concatenate(sources)
+    targets = np.concatenate(targets)
+
+    # Point each cell at its most populated close neighbour if that one is
+    # more populated than itself (ties go to the lower index)
+    parent = np.arange(len(keys))
+    upward = (counts[targets] > counts[sources]) | (
+        (counts[targets] == counts[sources]) & (targets < sources)
+    )
+    sources, targets = sources[upward], targets[upward]
+    order = np.lexsort((-targets, counts[targets], sources))
+    sources, targets = sources[order], targets[order]
+    last = np.ones(len(sources), dtype=bool)
+    last[:-1] = sources[1:] != sources[:-1]
+    parent[sources[last]] = targets[last]
+    parent = np.where(parent[parent] == parent, parent, np.arange(len(keys)))
+
+    _, cluster = np.unique(parent, return_inverse=True)
+    labels = cluster.ravel()[labels]
+    counts = np.bincount(labels)
+    center_x = np.bincount(labels, weights=x) / counts
+    center_y = np.bincount(labels, weights=y) / counts
+    return labels, center_x, center_y, counts
+
+
+def shade_counts(counts, cmap=RASTER_CMAP, how=RASTER_NORMALIZATION):
+    """
+    Maps a grid of counts to RGBA colors, with empty cells transparent.
+    "log" scales by log(1 + count); "eq_hist" scales by each count's rank
+    among the non-empty cells so the full colormap is used however skewed
+    the counts are.
+    """
+    filled = counts > 0
+    if not filled.any():
+        return np.zeros(counts.shape + (4,))
+    if how == "log":
+        values = np.log1p(counts) / np.log1p(counts.max())
+    elif how == "eq_hist":
+        ranked = np.sort(counts[filled])
+        values = np.searchsorted(ranked, counts, side="right") / len(ranked)
+    else:
+        raise ValueError(f"Unknown raster normalization {how!r}")
+    rgba = plt.get_cmap(cmap)(values)
+    rgba[~filled, 3] = 0
+    return rgba
+
+
+def plot_density(ax, df, dpi=MAP_DPI):
+    """
+    Draws the points as an image with one cell per output pixel of the axes,
+    shaded by how many points fall in it. The cost of drawing depends on the
+    size of the map rather than the number of points.
+    """
+    width, height = axes_pixel_size(ax, dpi)
+    extent = ax.get_extent()
+    projected = ax.projection.transform_points(
+        ccrs.PlateCarree(), df["longitude"].to_numpy(), df["latitude"].to_numpy()
+    )
+    counts = bin_points(projected[:, 0], projected[:, 1], extent, (height, width))
+    ax.imshow(shade_counts(counts), origin="lower", extent=extent, transform=ax.projection,
+              interpolation="nearest", aspect=ax.get_aspect(), zorder=3)
+    ax.set_extent(extent, crs=ax.projection)
+
+
+def lod_tolerance(extent, ax, dpi=MAP_DPI, max_error_px=BOUNDARY_MAX_ERROR_PX):
+    """
+    Returns the simplification tolerance for drawing extent (x0, x1, y0, y1)
+    on ax at dpi: the largest BOUNDARY_LOD_BASE * 2**k that is within
+    max_error_px pixels, or None if the full detail is needed.
+    """
+    x0, x1, y0, y1 = extent
+    box = ax.get_position()
+    width, height = ax.figure.get_size_inches() * dpi
+    # With an equal aspect the extent is fitted to the tighter of the two axes
+    pixel = max((x1 - x0) / (box.width * width), (y1 - y0) / (box.height * height))
+    return lod_level(pixel, max_error_px)
+
+
+def lod_level(pixel, max_error_px=BOUNDARY_MAX_ERROR_PX):
+    """
+    Returns the largest BOUNDARY_LOD_BASE * 2**k that is within max_error_px
+    pixels of `pixel` size, or None if the full detail is needed.
+    """
+    level = np.floor(np.log2(pixel * max_error_px / BOUNDARY_LOD_BASE))
+    return BOUNDARY_LOD_BASE * 2 ** int(level) if level >= 0 else None
+
+
+def boundary_for_axes(ax, path=BOUNDARY_FILE, extent=None, dpi=MAP_DPI):
+    """
+    Returns the boundary simplified to the level of detail that can be seen
+    when extent (the whole boundary by default) is drawn on ax at dpi.
+    """
+    boundary = load_boundary(path)
+    if extent is None:
+        x0, y0, x1, y1 = boundary.total_bounds
+        extent = (x0, x1, y0, y1)
+    tolerance = lod_tolerance(extent, ax, dpi)
+    if tolerance is None:
+        return boundary
+    return load_boundary(path, tolerance=tolerance)
+
+
+# A rendered basemap: the figure as an RGBA array, and the extent
+# (x0, x1, y0, y1) and aspect of its map axes.
+Basemap = namedtuple("Basemap", ["rgba", "extent", "aspect"])
+
+
+def render_basemap(figsize=MAP_FIGSIZE, dpi=MAP_DPI, extent=None, path=BOUNDARY_FILE):
+    """
+    Renders the boundary of `path` and the title without any points and
+    returns it as a Basemap. The extent defaults to fitting the boundary.
+    """
     # Use PlateCarree projection for a simple, rectangular map
+    fig = plt.figure(figsize=figsize, dpi=dpi)
     ax = fig.add_subplot(1, 1, 1, projection=ccrs.PlateCarree())
-    
+
     # Add the outline of MA
-    gdf = gpd.read_file("MA.geojson")
+    gdf = boundary_for_axes(ax, path, extent, dpi)
     gdf.plot(ax=ax, transform=ccrs.PlateCarree(), color="white", edgecolor='black')
+    if extent is not None:
+        ax.set_extent(extent, crs=ax.projection)
 
     # Add map features for context and aesthetic appeal
-    ax.set_title('Massachusetts Community Colleges', fontsize=16)
+    ax.set_title(MAP_TITLE, fontsize=16)
+
+    fig.canvas.draw()
+    basemap = Basemap(np.array(fig.canvas.buffer_rgba()), ax.get_extent(), ax.get_aspect())
+    plt.close(fig)
+    return basemap
+
+
+@functools.lru_cache(maxsize=8)
+def load_basemap(figsize=MAP_FIGSIZE, dpi=MAP_DPI, extent=None, path=BOUNDARY_FILE,
+                 cache_dir=BASEMAP_CACHE_DIR, max_files=BASEMAP_CACHE_MAX_FILES):
+    """
+    Returns render_basemap(figsize, dpi, extent, path), from cache_dir if it
+    has already been rendered from the current boundary file. Beyond
+    max_files basemaps, the least recently used are deleted.
+    """
+    options = json.dumps([
+        BASEMAP_VERSION, MAP_TITLE, list(figsize), dpi, extent and list(extent),
+        cached_file_sha256(path), BOUNDARY_MAX_ERROR_PX, BOUNDARY_LOD_BASE,
+    ])
+    key = hashlib.sha256(options.encode()).hexdigest()[:16]
+    cache_file = Path(cache_dir) / f"basemap-{key}.npz"
+    if cache_file.exists():
+        # Mark it as recently used
+        cache_file.touch()
+        with np.load(cache_file) as cached:
+            return Basemap(cached["rgba"], tuple(cached["extent"]), cached["aspect"].item())
+
+    basemap = render_basemap(figsize, dpi, extent, path)
+    # The basemap is mostly flat color, so it compresses to a fraction of a
+    # percent of its size and loads faster than it renders
+    tmp_file = temporary_path(cache_file)
+    with open(tmp_file, "wb") as f:
+        np.savez_compressed(f, rgba=basemap.rgba, extent=basemap.extent, aspect=basemap.aspect)
+    tmp_file.replace(cache_file)
+    cached_files = sorted(Path(cache_dir).glob("basemap-*.npz"), key=lambda f: f.stat().st_mtime,
+                          reverse=True)
+    for old_file in cached_files[max_files:]:
+        old_file.unlink(missing_ok=True)
+    return basemap
+
 
-    # A list of colors for each point
-    colors = ['red', 'blue', 'green', 'purple', 'orange', 'cyan', 'magenta', 'lime',
-              'brown', 'pink', 'gray', 'olive', 'teal', 'navy', 'maroon', 'gold']
+def map_overlay(basemap, figsize=MAP_FIGSIZE, dpi=MAP_DPI):
+    """
+    Returns a transparent figure with a map axes laid out exactly like the
+    one in the basemap, for drawing the points on.
+    """
+    fig = plt.figure(figsize=figsize, dpi=dpi)
+    fig.patch.set_alpha(0)
+    ax = fig.add_subplot(1, 1, 1, projection=ccrs.PlateCarree())
+    ax.set_extent(basemap.extent, crs=ax.projection)
+    ax.set_aspect(basemap.aspect)
+    ax.patch.set_visible(False)
+    ax.spines["geo"].set_visible(False)
+    return fig, ax
 
-    # Plot each point individually with a different color and label for the legend
-    for index, row in df.iterrows():
-        # Use modulo to cycle through colors if there are more addresses than colors
-        color = colors[index]
-        ax.scatter(row['longitude'], row['latitude'],
-                   transform=ccrs.PlateCarree(),
-                   color=color, marker='o', s=70,
-                   label=row['inst_name'])
+
+def save_map(fig, basemap, path=MAP_FILE):
+    """
+    Draws fig, composites it over the basemap image and saves the result.
+    """
+    fig.canvas.draw()
+    overlay = np.asarray(fig.canvas.buffer_rgba()).reshape(-1, 4)
+    composite = basemap.rgba.copy()
+    pixels = composite.reshape(-1, 4)
+
+    # Only blend the pixels the overlay actually drew on
+    drawn = np.flatnonzero(overlay[:, 3])
+    top = overlay[drawn].astype(np.uint16)
+    alpha = top[:, 3:]
+    blended = (top * alpha + pixels[drawn] * (255 - alpha) + 127) // 255
+    blended[:, 3] = 255
+    pixels[drawn] = blended
+    plt.imsave(path, composite, dpi=fig.dpi)
+    plt.close(fig)
+
+
+def render_mode(n):
+    """
+    Returns how to draw n points: RENDER_MODE, with "auto" resolved.
+    """
+    if RENDER_MODE == "auto":
+        return "raster" if n > RASTER_THRESHOLD else "points"
+    return RENDER_MODE
+
+
+def draw_points(ax, df, mode, dpi=MAP_DPI, names=None, cluster_radius=CLUSTER_RADIUS_PX):
+    """
+    Draws the points on ax as markers or, in "raster" mode, as a density
+    image. Returns the legend handles (none for a density image).
+    """
+    if mode == "raster":
+        plot_density(ax, df, dpi)
+        return []
+    return plot_points(ax, df, cluster_radius=cluster_radius, dpi=dpi, names=names)
+
+
+def ensure_geocoded():
+    """
+    Geocodes the input unless GEOCODED_FILE was already built from the
+    current input with the current settings. If only the input changed,
+    just the rows that changed are geocoded.
+    """
+    stored = read_manifest()
+    current = geocoding_manifest()
+    if stored != current:
+        incremental = stored is not None and all(
+            stored.get(key) == value for key, value in current.items() if key != "input_sha256"
+        )
+        do_geocoding(incremental=incremental)
+
+
+def create_map_from_csv():
+    """
+    Main function to read addresses from a CSV, geocode, and plot them on a map.
+    """
+    # See if the data has already been geocoded from the current input with
+    # the current settings
+    ensure_geocoded()
+
+    # Read in geocoded data
+    df = read_geocoded(["inst_name", "latitude", "longitude"])
+    
+    if df.empty:
+        print("No valid addresses to plot. Exiting.")
+        return
+
+    # Create the map using Cartopy and Matplotlib. The outline of MA and the
+    # title come from the cached basemap and only the points are drawn here.
+    basemap = load_basemap()
+    fig, ax = map_overlay(basemap)
+
+    # Plot all the points at once, with a different color for each
+    # institution, or shade the number of points per pixel when there are
+    # too many to draw individually
+    handles = draw_points(ax, df, render_mode(len(df)))
 
     # Add labels to the points (optional)
     # for index, row in df.iterrows():
@@ -114,11 +2069,254 @@ def create_map_from_csv():
     #             transform=ccrs.PlateCarree(), fontsize=8, ha='left')
 
     # Create the legend and place it at the bottom right
-    ax.legend(bbox_to_anchor=(0.015, -0.45), loc='lower left', ncol=2, fontsize=11)
-    fig.savefig('address_map.png', dpi=300)
-    print("Map saved as 'address_map.png'")
+    if handles:
+        add_legend(ax, handles)
+    save_map(fig, basemap, MAP_FILE)
+    print(f"Map saved as '{MAP_FILE}'")
+
+def tile_bounds(zoom, x, y):
+    """
+    Returns the extent (x0, x1, y0, y1) of a z/x/y tile in Web Mercator meters.
+    """
+    size = 2 * MERCATOR_HALF_WIDTH / 2 ** zoom
+    x0 = -MERCATOR_HALF_WIDTH + x * size
+    y1 = MERCATOR_HALF_WIDTH - y * size
+    return x0, x0 + size, y1 - size, y1
+
+
+def tile_lonlat_bounds(zoom, x, y):
+    """
+    Returns the (lon0, lat0, lon1, lat1) bounds of z/x/y tiles. Works on
+    arrays of x and y.
+    """
+    n = 2 ** zoom
+    lon0 = np.asarray(x) / n * 360 - 180
+    lon1 = (np.asarray(x) + 1) / n * 360 - 180
+    lat1 = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * np.asarray(y) / n))))
+    lat0 = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (np.asarray(y) + 1) / n))))
+    return lon0, lat0, lon1, lat1
+
+
+def lonlat_to_tile_coords(longitudes, latitudes, zoom):
+    """
+    Returns the fractional tile x and y of each point at zoom.
+    """
+    n = 2 ** zoom
+    x = (np.asarray(longitudes) + 180) / 360 * n
+    y = (1 - np.arcsinh(np.tan(np.radians(latitudes))) / np.pi) / 2 * n
+    return x, y
+
+
+def tile_coords_to_mercator(fx, fy, zoom):
+    """
+    Returns the Web Mercator x and y in meters of fractional tile coordinates.
+    """
+    size = 2 * MERCATOR_HALF_WIDTH / 2 ** zoom
+    return -MERCATOR_HALF_WIDTH + np.asarray(fx) * size, MERCATOR_HALF_WIDTH - np.asarray(fy) * size
+
+
+def point_tiles(longitudes, latitudes, zoom, margin_px=TILE_MARGIN_PX):
+    """
+    Returns a dict of (x, y) tile to the indices of the points whose markers
+    (within margin_px of the point) reach into it.
+    """
+    return coord_tiles(*lonlat_to_tile_coords(longitudes, latitudes, zoom), zoom, margin_px)
+
+
+def coord_tiles(fx, fy, zoom, margin_px=TILE_MARGIN_PX):
+    """
+    Same as point_tiles, for points given as fractional tile coordinates.
+    """
+    n = 2 ** zoom
+    index = np.arange(len(fx))
+    margin = margin_px / TILE_SIZE
+    pairs = np.unique(np.vstack([
+        np.column_stack([np.clip(np.floor(fx + dx), 0, n - 1),
+                         np.clip(np.floor(fy + dy), 0, n - 1), index])
+        for dx in (-margin, margin) for dy in (-margin, margin)
+    ]).astype(np.int64), axis=0)
+    if not len(pairs):
+        return {}
+
+    starts = np.flatnonzero(np.r_[True, (np.diff(pairs[:, :2], axis=0) != 0).any(axis=1)])
+    return {
+        (int(pairs[start, 0]), int(pairs[start, 1])): indices
+        for start, indices in zip(starts, np.split(pairs[:, 2], starts[1:]))
+    }
+
+
+def region_tiles(region, zoom):
+    """
+    Returns the set of (x, y) tiles at zoom that intersect region.
+    """
+    n = 2 ** zoom
+    lon0, lat0, lon1, lat1 = region.bounds
+    (x0, x1), (y1, y0) = lonlat_to_tile_coords([lon0, lon1], [lat0, lat1], zoom)
+    xs, ys = np.meshgrid(np.arange(max(int(x0), 0), min(int(x1), n - 1) + 1),
+                         np.arange(max(int(y0), 0), min(int(y1), n - 1) + 1))
+    xs, ys = xs.ravel(), ys.ravel()
+    boxes = shapely.box(*tile_lonlat_bounds(zoom, xs, ys))
+    hit = shapely.intersects(region, boxes)
+    return set(zip(xs[hit].tolist(), ys[hit].tolist()))
+
+
+def _render_tile(tile, df, clusters, names, mode, tolerance, path):
+    """
+    Renders one z/x/y tile of the boundary, the points in df and the
+    cluster markers in `clusters` (rows of Web Mercator x, y and count) to
+    path. The points are not clustered again here, since that would start
+    from the tile's own edge. Runs in a worker process of export_tiles.
+    """
+    zoom, x, y = tile
+    extent = tile_bounds(zoom, x, y)
+    fig = plt.figure(figsize=(TILE_SIZE / TILE_DPI, TILE_SIZE / TILE_DPI), dpi=TILE_DPI)
+    ax = fig.add_axes([0, 0, 1, 1], projection=ccrs.GOOGLE_MERCATOR)
+    ax.patch.set_visible(False)
+    ax.spines["geo"].set_visible(False)
+
+    # Clip the boundary a little outside the tile so the clipped edges are
+    # not drawn
+    lon0, lat0, lon1, lat1 = tile_lonlat_bounds(zoom, x, y)
+    pad_lon, pad_lat = (lon1 - lon0) / 4, (lat1 - lat0) / 4
+    boundary = load_boundary(tolerance=tolerance)
+    boundary = boundary.clip_by_rect(lon0 - pad_lon, lat0 - pad_lat, lon1 + pad_lon, lat1 + pad_lat)
+    boundary = boundary[~boundary.is_empty]
+    if len(boundary):
+        boundary.plot(ax=ax, transform=ccrs.PlateCarree(), color="white", edgecolor='black',
+                      aspect=None)
+    ax.set_extent(extent, crs=ax.projection)
+
+    if len(df):
+        draw_points(ax, df, mode, TILE_DPI, names, cluster_radius=0)
+    if len(clusters):
+        plot_clusters(ax, clusters[:, 0], clusters[:, 1], clusters[:, 2].astype(np.int64))
+    ax.set_extent(extent, crs=ax.projection)
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    fig.savefig(path, dpi=TILE_DPI, transparent=True)
+    plt.close(fig)
+
+
+def export_tiles(min_zoom=TILE_MIN_ZOOM, max_zoom=TILE_MAX_ZOOM, tile_dir=TILE_DIR,
+                 workers=TILE_WORKERS):
+    """
+    Renders the boundary and the geocoded points as Web Mercator z/x/y PNG
+    tiles in tile_dir, which can be served as-is by any static web server.
+    Only tiles that touch the boundary or a point are rendered, and only if
+    what goes into them changed since the last export.
+    """
+    ensure_geocoded()
+    df = read_geocoded(["inst_name", "latitude", "longitude"])
+    df = df[np.isfinite(df["latitude"]) & np.isfinite(df["longitude"])].reset_index(drop=True)
+    codes, names = pd.factorize(df["inst_name"], use_na_sentinel=False)
+    names = list(names)
+    colors = categorical_palette(len(names))[codes]
+    mode = render_mode(len(df))
+    region = load_region()
+
+    # Everything besides the tile's own points and boundary that changes how
+    # a tile looks
+    settings = json.dumps([
+        BASEMAP_VERSION, cached_file_sha256(BOUNDARY_FILE), mode, MARKER_SIZE,
+        CLUSTER_RADIUS_PX, CLUSTER_COLOR, RASTER_CMAP, RASTER_NORMALIZATION,
+        TILE_SIZE, TILE_DPI,
+    ])
+    manifest_file = Path(tile_dir) / "manifest.json"
+    try:
+        previous = json.loads(manifest_file.read_text())
+    except (OSError, ValueError):
+        previous = {}
+
+    # --- 1. Find the tiles to render and hash their contents ---
+    manifest = {}
+    jobs = []
+    longitudes = df["longitude"].to_numpy()
+    latitudes = df["latitude"].to_numpy()
+    no_points = np.array([], dtype=np.int64)
+    for zoom in range(min_zoom, max_zoom + 1):
+        # Simplify the boundary to the size of a pixel at the region's latitude
+        pixel = 360 / (TILE_SIZE * 2 ** zoom) * np.cos(np.radians(region.centroid.y))
+        tolerance = lod_level(pixel)
+
+        # Cluster once per zoom on the world pixel grid, so that a point
+        # falls in the same cluster in every tile its marker reaches
+        fx, fy = lonlat_to_tile_coords(longitudes, latitudes, zoom)
+        singles = np.arange(len(df))
+        cluster_x = cluster_y = counts = np.empty(0)
+        if mode == "points" and CLUSTER_RADIUS_PX:
+            world = TILE_SIZE * 2 ** zoom
+            labels, cluster_x, cluster_y, counts = cluster_points(
+                fx, fy, (0, 2 ** zoom, 0, 2 ** zoom), (world, world), CLUSTER_RADIUS_PX
+            )
+            singles = np.flatnonzero(counts[labels] == 1)
+            clustered = counts > 1
+            cluster_x, cluster_y, counts = cluster_x[clustered], cluster_y[clustered], counts[clustered]
+        clusters = np.column_stack([*tile_coords_to_mercator(cluster_x, cluster_y, zoom), counts])
+        cluster_tiles = coord_tiles(cluster_x, cluster_y, zoom)
+        with_points = coord_tiles(fx[singles], fy[singles], zoom)
+
+        for x, y in sorted(region_tiles(region, zoom) | with_points.keys() | cluster_tiles.keys()):
+            rows = singles[with_points.get((x, y), no_points)]
+            markers = clusters[cluster_tiles.get((x, y), no_points)]
+            digest = hashlib.sha256(settings.encode())
+            digest.update(json.dumps([zoom, x, y, tolerance]).encode())
+            for values in (longitudes[rows], latitudes[rows], colors[rows], markers):
+                digest.update(np.ascontiguousarray(values).tobytes())
+
+            key = f"{zoom}/{x}/{y}"
+            path = Path(tile_dir) / f"{key}.png"
+            if previous.get(key) == digest.hexdigest() and path.exists():
+                manifest[key] = previous[key]
+            else:
+                jobs.append((key, digest.hexdigest(), (zoom, x, y), rows, markers, tolerance, path))
+
+    # --- 2. Remove tiles that are no longer part of the export ---
+    for key in previous.keys() - manifest.keys() - {job[0] for job in jobs}:
+        (Path(tile_dir) / f"{key}.png").unlink(missing_ok=True)
+
+    # --- 3. Render the changed tiles ---
+    # Build each zoom's simplified boundary up front, so the workers only
+    # ever read it from the cache
+    for tolerance in sorted({job[5] for job in jobs}):
+        load_boundary(tolerance=tolerance)
+    print(f"Rendering {len(jobs)} tiles ({len(manifest)} unchanged)")
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(_render_tile, tile, df.iloc[rows], markers, names, mode, tolerance,
+                            str(path)):
+                (key, digest)
+                for key, digest, tile, rows, markers, tolerance, path in jobs
+            }
+            for future in as_completed(futures):
+                future.result()
+                key, digest = futures[future]
+                manifest[key] = digest
+    finally:
+        manifest_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = manifest_file.with_suffix(".tmp")
+        tmp_file.write_text(json.dumps(dict(sorted(manifest.items())), indent=0))
+        tmp_file.replace(manifest_file)
+    print(f"Tiles saved in '{tile_dir}'")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(
+        description="Geocode the addresses in the input CSV and map them."
+    )
+    parser.add_argument("--tiles", action="store_true",
+                        help="export z/x/y map tiles instead of a single map image")
+    parser.add_argument("--min-zoom", type=int, default=TILE_MIN_ZOOM, help="lowest tile zoom level")
+    parser.add_argument("--max-zoom", type=int, default=TILE_MAX_ZOOM, help="highest tile zoom level")
+    args = parser.parse_args()
+
+    if args.tiles:
+        export_tiles(args.min_zoom, args.max_zoom)
+    else:
+        create_map_from_csv()
+
 
 # Execute the function
 if __name__ == "__main__":
-    create_map_from_csv()
+    main_cli()
 